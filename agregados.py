@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+import carga
+import geografia
+import indices
+
+# ---------- Agregados compartidos por el dashboard y el reporte PDF ----------
+LIMITE_AGREGADOS_BYTES = 64 * 1024 * 1024
+
+
+class Agregados:
+    """Conteos, promedios, distintos y tablas cruzadas de una combinación de filtros, calculados una sola vez.
+
+    Todas las secciones (tarjetas, mapa, pestañas, resumen y PDF) leen de aquí en vez de repetir
+    sus propios groupby. Cada tabla sale del roll-up más pequeño del cubo que la puede responder con
+    esos filtros, y solo se guardan las tablas resultantes, que son pequeñas y se pueden memorizar
+    por (dataset, filtros).
+
+    Con `limite_muestra` (modo aproximado) las tablas que tendrían que recorrer más filas que eso
+    salen de una muestra ponderada; `estimado` indica si alguna lo hizo.
+    """
+
+    def __init__(self, cubo, filtros, limite_muestra=None):
+        cortar = cubo.cortador(filtros, limite_muestra)
+        celdas = cortar()
+        self.total = int(np.rint(celdas['total'].sum()))
+        self.rating_promedio = (celdas['suma_estrellas'].sum() / celdas['cuenta_estrellas'].sum()
+                                if 'estrellas' in cubo.promedios and celdas['cuenta_estrellas'].sum() else float('nan'))
+
+        def por(dimension, nombres=()):
+            if not cubo.tiene(dimension):
+                return None
+            return cubo.agrupar(cortar(dimension), dimension)[['total'] + [n for n in nombres if n in cubo.promedios]]
+
+        def conteos(dimension):
+            tabla = por(dimension)
+            return None if tabla is None else tabla['total'].sort_values(ascending=False, kind='stable')
+
+        def cruzar(filas, columnas):
+            return cubo.cruzar(cortar(filas, columnas), filas, columnas).sort_index() if cubo.tiene(filas, columnas) else None
+
+        self.por_categoria = por('predicted_category', ['estrellas', 'confianza'])
+        self.por_ciudad = por('city', ['estrellas'])
+        self.por_sentimiento = conteos('Clasificacion')
+        self.por_rating = conteos('PuntajeEstrellas')
+        if self.por_rating is not None:
+            self.por_rating = self.por_rating.sort_index()
+        # Mapa y PDF leen la misma columna normalizada; el PDF solo cambia el código por el nombre
+        self.por_codigo_estado = conteos('estado_canonico')
+        self.por_estado = None
+        if self.por_codigo_estado is not None:
+            self.por_estado = self.por_codigo_estado.set_axis(
+                geografia.nombres_estados(self.por_codigo_estado.index.astype(str)))
+        self.por_producto = conteos('product type')
+
+        self.sentimiento_categoria = cruzar('predicted_category', 'Clasificacion')
+        self.ciudad_categoria = cruzar('city', 'predicted_category')
+        # nunique de categorías por ciudad sale de la tabla cruzada, sin otro groupby
+        self.categorias_por_ciudad = ((self.ciudad_categoria > 0).sum(axis=1)
+                                      if self.ciudad_categoria is not None else None)
+
+        self.ciudades_distintas = len(self.por_ciudad) if self.por_ciudad is not None else None
+        if cortar.estimado and self.por_ciudad is not None:
+            # En la muestra puede faltar una ciudad con pocas filas: las opciones en cascada de la barra
+            # lateral (exactas y ya calculadas) dicen qué ciudades tienen filas con los demás filtros
+            elegidas = filtros.get('city')
+            opciones = cubo.opciones('city', filtros)
+            self.ciudades_distintas = len(set(opciones) & set(elegidas)) if elegidas else len(opciones)
+        self.categorias_distintas = len(self.por_categoria) if self.por_categoria is not None else None
+        self.negativas = (int(self.por_sentimiento.get('Negativo', 0))
+                          if self.por_sentimiento is not None else None)
+
+        # Serie semanal: las celdas vienen por día; resample suma los días de cada semana
+        self.serie_semanal = None
+        if cubo.tiene('dia'):
+            self.serie_semanal = conteos('dia').sort_index().resample('W').sum()
+        self.estimado = cortar.estimado
+
+    def memoria(self):
+        """Bytes de las tablas guardadas (para la caché compartida)."""
+        return sum(carga.tamano_objeto(tabla) for tabla in vars(self).values()
+                   if isinstance(tabla, (pd.DataFrame, pd.Series)))
+
+
+_memoria = carga.CacheLRU(LIMITE_AGREGADOS_BYTES)
+
+
+def obtener(cubo, hash_dataset, filtros, limite_muestra=None):
+    """Agregados memorizados por huella del dataset, combinación de filtros y modo (compartidos entre sesiones)."""
+    clave = (hash_dataset, indices.clave_filtros(filtros), limite_muestra)
+    return _memoria.obtener_o_construir(clave, lambda: Agregados(cubo, filtros, limite_muestra))
@@ -1,16 +1,15 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-import folium
-import requests
-from branca.colormap import LinearColormap
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
 from matplotlib.backends.backend_pdf import PdfPages
 from datetime import datetime
 import matplotlib.image as mpimg
 import base64
 import io
+import carga
+import esquema
+import mapas
 
 # ---------- Configuración inicial de la página ----------
 st.set_page_config(layout="wide")
@@ -21,7 +20,11 @@ archivo = st.file_uploader("Sube el archivo Excel con los datos de opiniones", t
 logo_path = "logo.jpg"  # Debes subir también este archivo
 
 if archivo is not None:
-    df = pd.read_excel(archivo)
+    barra_carga = st.progress(0.0, text="Leyendo archivo...")
+    df, _ = carga.leer_archivo_cacheado(archivo, progreso=barra_carga.progress)
+    barra_carga.empty()
+    # Los conteos de abajo no usan observed: solo deben ver las categorías que tienen filas
+    df = esquema.quitar_categorias_sin_uso(df)
 
     # Verificación rápida de columnas necesarias
     columnas_necesarias = ["city", "predicted_category", "PuntajeEstrellas", "Clasificacion", "message"]
@@ -54,35 +57,9 @@ if archivo is not None:
         # Crear diccionario de valores para acceso rápido
         state_data = dict(zip(state_counts['state_code'], state_counts['count']))
 
-        # Obtener el GeoJSON de los estados de EE.UU.
-        url = 'https://raw.githubusercontent.com/python-visualization/folium/master/examples/data/us-states.json'
-        geo_json_data = requests.get(url).json()
-
-        # Crear colormap personalizado
+        # Mapa coloreado con la paleta personalizada; se renderiza una vez por conjunto de conteos
         custom_colors = ["#F2A30F", "#F22259"]
-        min_count = min(state_data.values())
-        max_count = max(state_data.values())
-        colormap = LinearColormap(colors=custom_colors, vmin=min_count, vmax=max_count)
-
-        # Crear el mapa base
-        us_map = folium.Map(location=[39.8283, -98.5795], zoom_start=4)
-
-        folium.GeoJson(
-            geo_json_data,
-            name='choropleth',
-            style_function=lambda feature: {
-                'fillColor': colormap(state_data.get(feature['id'], 0)),
-                'color': 'black',
-                'weight': 0.5,
-                'fillOpacity': 0.7,
-            },
-            tooltip=folium.GeoJsonTooltip(fields=['name'], aliases=['Estado:'])
-        ).add_to(us_map)
-
-        colormap.caption = 'Cantidad de Registros por Estado'
-        colormap.add_to(us_map)
-
-        folium_static(us_map)
+        components.html(mapas.coropletico_estados(state_data, custom_colors, zoom=4), width=700, height=510)
 
         # ---------- Botón para generar PDF ----------
         if st.button("📄 Generar Reporte PDF"):
@@ -13,6 +13,8 @@ import ast
 from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.image as mpimg
 from matplotlib.colors import LinearSegmentedColormap
+import carga
+import esquema
 
 # ---------- Configuración inicial de la página ----------
 st.set_page_config(
@@ -149,7 +151,9 @@ with st.sidebar:
     
     if archivo is not None:
         try:
-            df = pd.read_excel(archivo)
+            barra_carga = st.progress(0.0, text="Leyendo archivo...")
+            df, _ = carga.leer_archivo_cacheado(archivo, progreso=barra_carga.progress)
+            barra_carga.empty()
             st.session_state.df = df
             st.success("Archivo cargado correctamente")
             
@@ -159,7 +163,7 @@ with st.sidebar:
                 df = pd.DataFrame()  # Reiniciar el DataFrame si no hay columnas necesarias
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
-            df = pd.read_excel(archivo)
+            df, _ = carga.leer_archivo_cacheado(archivo)
             
             # Filtros dinámicos con verificación de columnas
             filtros = {}
@@ -190,6 +194,8 @@ if 'df' in locals() and not df.empty:
     for col, valor in filtros.items():
         if valor not in ['Todas', 'Todos']:
             df = df[df[col] == valor]
+    # Las columnas category conservan las categorías filtradas: sin quitarlas, los conteos las listarían con 0
+    df = esquema.quitar_categorias_sin_uso(df)
     
     # ---------- Botón para generar PDF (parte superior) ----------
 st.markdown("---")
@@ -1,18 +1,25 @@
 from datetime import datetime
+import time
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-import folium
-import requests
-from branca.colormap import LinearColormap
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
 from wordcloud import WordCloud
 from collections import Counter
 import ast
 from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.image as mpimg
 from matplotlib.colors import LinearSegmentedColormap
+import carga
+import esquema
+import historico
+import indices
+import aproximado
+import figuras
+import agregados
+import cubo
+import mapas
 #hola
 
 # ---------- Configuración inicial de la página ----------
@@ -106,6 +113,30 @@ st.markdown(f"""
             -webkit-text-fill-color: transparent;
         }}
 
+/* Tarjetas vacías mientras se cargan los datos */
+.metric-card.skeleton .metric-value {{
+    width: 60%;
+    border-radius: 6px;
+    background: linear-gradient(90deg, #f2f2f2 25%, #e6e6e6 50%, #f2f2f2 75%);
+    background-size: 200% 100%;
+    animation: skeleton-brillo 1.2s ease-in-out infinite;
+}}
+@keyframes skeleton-brillo {{
+    0% {{ background-position: 200% 0; }}
+    100% {{ background-position: -200% 0; }}
+}}
+
+/* Distintivo del modo aproximado */
+.badge-aproximado {{
+    display: inline-block;
+    padding: 0.2rem 0.7rem;
+    border-radius: 999px;
+    background: var(--warning);
+    color: white;
+    font-weight: 600;
+    font-size: 0.85rem;
+}}
+
 /* ---------- Sidebar ---------- */
 [data-testid="stSidebar"] {{
     background: var(--light);
@@ -142,61 +173,177 @@ st.markdown(f"""
     <div class="header-subtitle">Análisis inteligente de quejas</div>
 </div>
 """, unsafe_allow_html=True)
+# ---------- Esqueleto mientras se cargan los datos ----------
+contenedor_principal = st.container()
+
+
+def mostrar_esqueleto_metricas():
+    st.markdown("---")
+    st.subheader("Información general")
+    for columna, nombre in zip(st.columns(4), ['Total Opiniones', 'Ciudades Únicas', 'Quejas', 'Rating Promedio']):
+        with columna:
+            st.markdown(f"""
+            <div class="metric-card skeleton">
+                <div class="metric-title">{nombre}</div>
+                <div class="metric-value">&nbsp;</div>
+            </div>
+            """, unsafe_allow_html=True)
+    st.info("Procesando los datos en segundo plano; las secciones aparecerán al terminar.")
+
+
+def formatear_promedio(valor, decimales):
+    """Número con `decimales` decimales, o "—" si no hay valor (p. ej. sin estrellas válidas)."""
+    return "—" if pd.isna(valor) else f"{valor:.{decimales}f}"
+
+
 # ---------- Carga de archivo ----------
 with st.sidebar:
     st.image("logo.jpg", width=150)
     st.title("Filtros")
-    archivo = st.file_uploader("Subir archivo Excel", type=["xlsx"])
+    archivos = st.file_uploader("Subir archivos de datos", type=carga.FORMATOS_ADMITIDOS,
+                                accept_multiple_files=True)
+    with st.expander("Opciones de carga"):
+        carpeta = st.text_input("Carpeta local con exportaciones (opcional)")
+        limite_filas = st.number_input("Límite de filas (0 = sin límite)", min_value=0, value=0, step=10000)
+        porcentaje_muestreo = st.slider("Muestreo de filas (%)", min_value=1, max_value=100, value=100)
+        modo_incremental = st.checkbox("Añadir al histórico (solo filas nuevas por complaint id)")
+        modo_aproximado = st.checkbox("Modo aproximado (datasets muy grandes)",
+                                      help="Nube de palabras y comentarios sobre una muestra estratificada por "
+                                           f"categoría de hasta {aproximado.LIMITE_MUESTRA:,} filas; los gráficos "
+                                           "que no salen de los totales precalculados usan esa muestra con pesos.")
+        if modo_incremental and st.button("Vaciar histórico"):
+            historico.reiniciar()
     filtros = {}
 
-    if archivo is not None:  # Solo intentar cargar el archivo si no es None
+    if archivos or carpeta:  # Solo intentar cargar si hay archivos subidos o una carpeta indicada
         try:
-            df = pd.read_excel(archivo)
+            fuentes = list(archivos or [])
+            if carpeta:
+                fuentes += carga.archivos_en_carpeta(carpeta.strip())
+            if not fuentes:
+                raise ValueError("La carpeta indicada no contiene archivos de datos")
+            opciones_carga = {
+                'limite_filas': int(limite_filas) or None,
+                'fraccion_muestreo': porcentaje_muestreo / 100 if porcentaje_muestreo < 100 else None,
+            }
+
+            def cargar_dataset(progreso):
+                # Corre en un hilo de fondo: aquí no se puede llamar a st.*
+                datos, huella = carga.leer_varios_cacheado(fuentes, progreso=progreso, **opciones_carga)
+                nuevas = None
+                if modo_incremental:
+                    # El histórico entrega el dataset ya preparado, con índice y cubo extendidos con el lote
+                    progreso(1.0, "Añadiendo las filas nuevas al histórico...")
+                    datos, huella, capacidades, nuevas = historico.fusionar(datos, huella)
+                else:
+                    # Alias, columnas derivadas y mapa de capacidades: una vez por dataset
+                    datos, capacidades = carga.preparar_cacheado(datos, huella)
+                progreso(1.0, "Indexando el dataset...")
+                indices.obtener(datos, huella)  # Índice de filtros listo antes de pintar la barra lateral
+                cubo.obtener(datos, huella)  # Cubo de conteos y sumas del que salen todos los agregados
+                return datos, huella, capacidades, nuevas
+
+            clave_carga = repr(([carga.huella_fuente(f) for f in fuentes], opciones_carga, modo_incremental))
+            # Con el histórico la clave también lleva su estado: un trabajo solo se reutiliza si no cambió
+            trabajo_carga = (historico.en_segundo_plano(clave_carga, cargar_dataset) if modo_incremental
+                             else carga.en_segundo_plano(clave_carga, cargar_dataset))
+            if not trabajo_carga.terminado():
+                # La cabecera ya está pintada: mostrar el esqueleto del dashboard y volver a consultar en breve
+                st.progress(trabajo_carga.fraccion, text=trabajo_carga.texto)
+                with contenedor_principal:
+                    mostrar_esqueleto_metricas()
+                time.sleep(0.3)
+                st.rerun()
+            df, hash_dataset, capacidades, filas_nuevas = trabajo_carga.resultado()
+            if modo_incremental:
+                st.info(f"Histórico: {filas_nuevas:,} filas nuevas, {len(df):,} en total")
             st.session_state.df = df
-            st.success("Archivo cargado correctamente")
+            st.success(f"{len(fuentes)} archivo(s) cargado(s) correctamente")
+            stats_cache = carga.cache_datasets.estadisticas()
+            st.caption(f"Caché: {stats_cache['aciertos']} aciertos / {stats_cache['fallos']} fallos · "
+                       f"{stats_cache['bytes'] / 1024**2:.1f} de {stats_cache['limite_bytes'] / 1024**2:.0f} MB")
+            reporte = carga.reportes_memoria.obtener(hash_dataset)
+            if reporte is not None:
+                with st.expander("Memoria del dataset"):
+                    st.dataframe(reporte.style.format(
+                        {'MB antes': '{:.2f}', 'MB después': '{:.2f}'}))
             
+            if capacidades.alias:
+                st.caption("Columnas renombradas: " + ", ".join(f"{o} → {c}" for o, c in capacidades.alias.items()))
+
             # Verificar si las columnas necesarias existen
-            if 'city' not in df.columns or 'predicted_category' not in df.columns:
+            if not capacidades.tiene('city', 'predicted_category'):
                 st.warning("El archivo no contiene las columnas necesarias para el análisis.")
                 df = pd.DataFrame()  # Reiniciar el DataFrame si no hay columnas necesarias
+                capacidades = esquema.Capacidades([], {}, {})
             
-            # Filtros dinámicos con verificación de columnas
-            columnas_disponibles = df.columns.tolist()
-            
-            if 'city' in columnas_disponibles:
-                ciudades = ['Todas'] + sorted(df['city'].dropna().unique().tolist())
-                filtros['city'] = st.selectbox("Seleccionar ciudad", ciudades)
-            
-            if 'predicted_category' in columnas_disponibles:
-                categorias = ['Todas'] + sorted(df['predicted_category'].dropna().unique().tolist())
-                filtros['predicted_category'] = st.selectbox("Seleccionar categoría", categorias)
-            
-            if 'Clasificacion' in columnas_disponibles:
-                sentimientos = ['Todos'] + sorted(df['Clasificacion'].dropna().unique().tolist())
-                filtros['Clasificacion'] = st.selectbox("Seleccionar sentimiento", sentimientos)
-
-            if 'product type' in columnas_disponibles:
-                productos = ['Todos'] + sorted(df['product type'].dropna().unique().tolist())
-                filtros['product type'] = st.selectbox("Seleccionar producto", productos)
+            # Filtros dinámicos según las capacidades del dataset (sin selección = todos los valores).
+            # Las opciones salen del cubo y van en cascada: cada lista solo ofrece los valores que aparecen
+            # con lo elegido en las demás, así que se leen primero las selecciones guardadas en la sesión
+            cubo_datos = cubo.obtener(df, hash_dataset)
+            columnas_filtro = [col for col in ['city', 'predicted_category', 'Clasificacion', 'product type']
+                               if capacidades.tiene(col)]
+            seleccion = {}
+            for col in columnas_filtro:
+                # Descartar valores elegidos con un dataset anterior que ya no existen
+                elegidos = [v for v in st.session_state.get(f"filtro_{col}", []) if v in cubo_datos.valores[col]]
+                st.session_state[f"filtro_{col}"] = elegidos
+                seleccion[col] = tuple(elegidos)
+
+            extremos_fechas = indices.obtener(df, hash_dataset).extremos_fechas() if capacidades.tiene('fecha') else None
+            hay_rango_fechas = extremos_fechas is not None and extremos_fechas[0] < extremos_fechas[1]
+            if hay_rango_fechas:
+                rango = tuple(st.session_state.get("filtro_fecha", extremos_fechas))
+                if not extremos_fechas[0] <= rango[0] <= rango[1] <= extremos_fechas[1]:
+                    rango = extremos_fechas
+                st.session_state["filtro_fecha"] = rango
+                if rango != extremos_fechas:
+                    # Con el rango completo no se filtra: se conservan las filas sin fecha
+                    seleccion[indices.COLUMNA_FECHA] = rango
+
+            etiquetas = {
+                'city': ("Seleccionar ciudades", "Todas"),
+                'predicted_category': ("Seleccionar categorías", "Todas"),
+                'Clasificacion': ("Seleccionar sentimientos", "Todos"),
+                'product type': ("Seleccionar productos", "Todos"),
+            }
+            for col in columnas_filtro:
+                opciones = sorted(set(cubo_datos.opciones(col, seleccion)) | set(seleccion[col]))
+                etiqueta, marcador = etiquetas[col]
+                st.multiselect(etiqueta, opciones, placeholder=marcador, key=f"filtro_{col}")
+
+            if hay_rango_fechas:
+                st.slider("Rango de fechas", min_value=extremos_fechas[0], max_value=extremos_fechas[1],
+                          format="DD/MM/YYYY", key="filtro_fecha")
+            filtros.update(seleccion)
 
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
     else:
-        st.warning("Por favor, sube un archivo Excel.")
+        st.warning("Por favor, sube un archivo de datos (Excel, CSV, Parquet o JSONL).")
 
 # ---------- Procesamiento de datos ----------
 if 'df' in locals() and not df.empty:
-    # Aplicar filtros de forma segura
-    for col, valor in filtros.items():
-        if valor not in ['Todas', 'Todos']:
-            df = df[df[col] == valor]
+    # Conteos, promedios y tablas cruzadas de la vista: cortando el cubo, una sola vez para todas las secciones
+    # En modo aproximado, las tablas que tendrían que recorrer muchas filas salen de una muestra ponderada
+    vista = agregados.obtener(cubo.obtener(df, hash_dataset), hash_dataset, filtros,
+                              aproximado.LIMITE_MUESTRA if modo_aproximado else None)
+
+    # Filas filtradas solo para las secciones que muestran registros (nube de palabras, comentarios),
+    # y solo de las columnas que usan: `df` sigue siendo el dataset completo, sin copias ni columnas añadidas.
+    # Memorizadas por combinación de filtros; en modo aproximado solo se copia una muestra estratificada
+    columnas_registros = [col for col in ['tokens', 'message', 'Clasificacion'] if capacidades.tiene(col)]
+    if modo_aproximado:
+        registros, filas_vista = aproximado.filtrar_muestra(df, hash_dataset, filtros, columnas_registros)
+    else:
+        registros = indices.filtrar(df, hash_dataset, filtros, columnas_registros)
     
     # ---------- Botón para generar PDF (parte superior) ----------
 st.markdown("---")
 st.subheader("Reporte")
 
 if st.button("📥 Generar Reporte PDF", use_container_width=True):
-    if df.empty:
+    if 'vista' not in locals() or not vista.total:
         st.warning("No hay datos para generar el reporte")
     else:
         try:
@@ -224,9 +371,9 @@ if st.button("📥 Generar Reporte PDF", use_container_width=True):
                 plt.close()
 
                 # ----------- DISTRIBUCIÓN POR CATEGORÍA -----------
-                if 'predicted_category' in df.columns and 'PuntajeEstrellas' in df.columns:
+                if capacidades.puede('pdf_distribucion_categorias'):
                     fig, ax = plt.subplots(figsize=(16, 9))
-                    category_counts = df['predicted_category'].value_counts()
+                    category_counts = vista.por_categoria['total'].sort_values(ascending=False)
                     category_counts.plot(kind='bar', color=colores_empresa_lista)
                     plt.title("Distribución por Categoría", fontsize=20, color=colores_empresa['primary'])
                     plt.xticks(rotation=45, ha='right')
@@ -236,227 +383,250 @@ if st.button("📥 Generar Reporte PDF", use_container_width=True):
                     plt.close()
 
                 # ----------- RESUMEN GENERAL DE DATOS -----------
-                fig, ax = plt.subplots(figsize=(16, 9))
-                ax.axis('off')
-                num_ciudades = df["city"].nunique()
-                num_categorias = df["predicted_category"].nunique()
-                num_mensajes = len(df)
-                promedio_estrellas = df["PuntajeEstrellas"].mean()
-                categorias = [
-                    "• Request for shipping to the user's postal address",
-                    "• Request for shipping to a specific hospital",
-                    "• Accidentally lost inside the hospital",
-                    "• Never received and still waiting",
-                    "• Request for tracking confirmation shipment"
-                ]
-                estadisticas = (f"Total de mensajes analizados: {num_mensajes}\n"
-                                f"Cantidad de ciudades distintas: {num_ciudades}\n"
-                                f"Cantidad de categorías predichas: {num_categorias}\n"
-                                f"Promedio general de estrellas: {promedio_estrellas:.2f}\n\n"
-                                "Categorías disponibles:\n" + "\n".join(categorias))
-                ax.text(0.5, 0.95, 'Resumen General de Datos', fontsize=24, fontweight='bold', ha='center', color=colores_empresa[0])
-                ax.text(0.5, 0.6, estadisticas, fontsize=16, ha='center', va='top')
-                agregar_logo(fig)
-                pdf.savefig(fig)
-                plt.close()
-                    
+                if capacidades.puede('pdf_resumen_general'):
+                    fig, ax = plt.subplots(figsize=(16, 9))
+                    ax.axis('off')
+                    num_ciudades = vista.ciudades_distintas
+                    num_categorias = vista.categorias_distintas
+                    num_mensajes = vista.total
+                    promedio_estrellas = vista.rating_promedio
+                    categorias = [
+                        "• Request for shipping to the user's postal address",
+                        "• Request for shipping to a specific hospital",
+                        "• Accidentally lost inside the hospital",
+                        "• Never received and still waiting",
+                        "• Request for tracking confirmation shipment"
+                    ]
+                    estadisticas = (f"Total de mensajes analizados: {num_mensajes}\n"
+                                    f"Cantidad de ciudades distintas: {num_ciudades}\n"
+                                    f"Cantidad de categorías predichas: {num_categorias}\n"
+                                    f"Promedio general de estrellas: {formatear_promedio(promedio_estrellas, 2)}\n\n"
+                                    "Categorías disponibles:\n" + "\n".join(categorias))
+                    ax.text(0.5, 0.95, 'Resumen General de Datos', fontsize=24, fontweight='bold', ha='center', color=colores_empresa_lista[0])
+                    ax.text(0.5, 0.6, estadisticas, fontsize=16, ha='center', va='top')
+                    agregar_logo(fig)
+                    pdf.savefig(fig)
+                    plt.close()
+
                     # ----------- PERCEPCIÓN POR CATEGORÍA -----------
-                fig = plt.figure(figsize=(16, 9))
-                category_order = df.groupby("predicted_category")["PuntajeEstrellas"].mean().sort_values(ascending=False).index
-                category_count = df.groupby("predicted_category")["PuntajeEstrellas"].count()
-                colors = colores_empresa * (len(category_order) // len(colores_empresa) + 1)
-                bars = plt.bar(category_order, category_count.loc[category_order], color=colors[:len(category_order)])
-                for bar, category in zip(bars, category_order):
-                        stars = df[df["predicted_category"] == category]["PuntajeEstrellas"].mean()
-                        plt.text(bar.get_x() + bar.get_width()/2, bar.get_height(),
-                                f'{stars:.1f}', ha='center', va='bottom', fontsize=12)
-                plt.suptitle("Percepción por Categoría", fontsize=20, fontweight='bold', color=colores_empresa[0])
-                plt.title("Distribución de Categorías Ordenadas por Estrellas Promedio", fontsize=14)
-                plt.xlabel("Categoría", ha="left")
-                plt.ylabel("Cantidad de Opiniones", va='bottom')
-                plt.xticks(rotation=15, ha="left")
-                plt.tight_layout()
-                agregar_logo(fig)
-                pdf.savefig(fig)
-                plt.close()
+                if capacidades.puede('pdf_percepcion_categoria'):
+                    fig = plt.figure(figsize=(16, 9))
+                    percepcion = vista.por_categoria.sort_values('estrellas', ascending=False)
+                    category_order = percepcion.index.astype(str)
+                    colors = colores_empresa_lista * (len(category_order) // len(colores_empresa_lista) + 1)
+                    bars = plt.bar(category_order, percepcion['total'], color=colors[:len(category_order)])
+                    for bar, stars in zip(bars, percepcion['estrellas']):
+                            plt.text(bar.get_x() + bar.get_width()/2, bar.get_height(),
+                                    f'{stars:.1f}', ha='center', va='bottom', fontsize=12)
+                    plt.suptitle("Percepción por Categoría", fontsize=20, fontweight='bold', color=colores_empresa_lista[0])
+                    plt.title("Distribución de Categorías Ordenadas por Estrellas Promedio", fontsize=14)
+                    plt.xlabel("Categoría", ha="left")
+                    plt.ylabel("Cantidad de Opiniones", va='bottom')
+                    plt.xticks(rotation=15, ha="left")
+                    plt.tight_layout()
+                    agregar_logo(fig)
+                    pdf.savefig(fig)
+                    plt.close()
 
                     # ----------- DISTRIBUCIÓN DE SENTIMIENTOS -----------
-                fig = plt.figure(figsize=(16, 9))
-                clasificacion_ordenada = ["Positivo", "Neutro", "Negativo"]
-                conteos = df["Clasificacion"].value_counts().reindex(clasificacion_ordenada)
-                colores = [colores_empresa[3], colores_empresa[2], colores_empresa[0]]
-                bars = plt.bar(conteos.index, conteos.values, color=colores)
-                for bar, count in zip(bars, conteos.values):
-                        plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height(),
-                                str(count), ha='center', va='bottom', fontsize=12)
-                plt.suptitle("Distribución de Sentimientos", fontsize=20, fontweight='bold', color=colores_empresa[0])
-                plt.title("Sentimientos en los Mensajes Recibidos", fontsize=14)
-                plt.xlabel("Clasificación")
-                plt.ylabel("Cantidad de Mensajes")
-                plt.tight_layout()
-                agregar_logo(fig)
-                pdf.savefig(fig)
-                plt.close()
+                if capacidades.puede('pdf_sentimientos'):
+                    fig = plt.figure(figsize=(16, 9))
+                    clasificacion_ordenada = ["Positivo", "Neutro", "Negativo"]
+                    conteos = vista.por_sentimiento.reindex(clasificacion_ordenada, fill_value=0)
+                    colores = [colores_empresa_lista[3], colores_empresa_lista[2], colores_empresa_lista[0]]
+                    bars = plt.bar(conteos.index, conteos.values, color=colores)
+                    for bar, count in zip(bars, conteos.values):
+                            plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height(),
+                                    str(count), ha='center', va='bottom', fontsize=12)
+                    plt.suptitle("Distribución de Sentimientos", fontsize=20, fontweight='bold', color=colores_empresa_lista[0])
+                    plt.title("Sentimientos en los Mensajes Recibidos", fontsize=14)
+                    plt.xlabel("Clasificación")
+                    plt.ylabel("Cantidad de Mensajes")
+                    plt.tight_layout()
+                    agregar_logo(fig)
+                    pdf.savefig(fig)
+                    plt.close()
 
                     # ----------- CATEGORÍAS GENERALES PREDICHAS -----------
-                fig = plt.figure(figsize=(16, 9))
-                category_count = df["predicted_category"].value_counts()
-                total = category_count.sum()
-                colors = colores_empresa * (len(category_count) // len(colores_empresa) + 1)
-                bars = plt.bar(category_count.index, category_count.values, color=colors[:len(category_count)])
-                for bar, count in zip(bars, category_count.values):
-                        percentage = (count / total) * 100
-                        plt.text(bar.get_x() + bar.get_width()/2, bar.get_height(),
-                                f'{percentage:.1f}%', ha='center', va='bottom', fontsize=12)
-                plt.suptitle("Categorías Generales Predichas", fontsize=20, fontweight='bold', color=colores_empresa[0])
-                plt.title("Distribución de Categorías de Correo Predichas", fontsize=14)
-                plt.xlabel("Categoría Predicha")
-                plt.ylabel("Número de Mensajes")
-                plt.xticks(rotation=15, ha="left")
-                plt.tight_layout()
-                agregar_logo(fig)
-                pdf.savefig(fig)
-                plt.close()
-                    
-                    # ----------- DISTRIBUCIÓN DE QUEJAS POR ESTADO -----------            
-                fig = plt.figure(figsize=(16, 9))
-                state_counts = df['state_name'].value_counts().head()
-                state_counts = state_counts.sort_values(ascending=True)
-                state_counts.index = state_counts.index.astype(str)
-                bars = state_counts.plot(kind='barh', color=colores_empresa[1], alpha=0.7)
-                plt.suptitle("Distribución de Quejas por Estado", fontsize=20, fontweight='bold', color=colores_empresa[0])
-                plt.title("Top 10 estados con más quejas (ordenados por frecuencia)", fontsize=14, pad=20)
-                plt.xlabel("Número de Quejas", fontsize=12)
-                plt.ylabel("Estado", fontsize=12)
-                for i, (count, state) in enumerate(zip(state_counts, state_counts.index)):
-                    label = f"{count} ({count/len(df)*100:.1f}%)"
-                    plt.text(count + 0.5, i, label, va='center', fontsize=11, color='black')
-                plt.tight_layout()
-                plt.subplots_adjust(left=0.2)
-                agregar_logo(fig)
-                pdf.savefig(fig)
-                plt.close()
-
-                    # ----------- CATEGORÍAS POR CIUDAD -----------
-                fig, ax = plt.subplots(figsize=(16, 9))
-                city_category_counts = df.groupby("city")["predicted_category"].nunique()
-                cities_to_plot = city_category_counts[city_category_counts > 1].index
-                ciudades_unica_categoria = df[df["city"].isin(city_category_counts[city_category_counts == 1].index)][["city", "predicted_category"]].drop_duplicates()
-
-                num_cols = 2
-                num_rows = int(np.ceil(len(cities_to_plot) / num_cols))
-                fig, axes = plt.subplots(num_rows, num_cols, figsize=(16, 5 * num_rows))
-                fig.suptitle("Categorías Predichas por Ciudad", fontsize=20, fontweight="bold", color=colores_empresa[0])
-                axes = axes.flatten()
-
-                for i, city in enumerate(cities_to_plot):
-                    city_data = df[df["city"] == city]
-                    category_count = city_data["predicted_category"].value_counts()
+                if capacidades.puede('pdf_categorias_predichas'):
+                    fig = plt.figure(figsize=(16, 9))
+                    category_count = vista.por_categoria['total'].sort_values(ascending=False)
+                    category_count.index = category_count.index.astype(str)
                     total = category_count.sum()
-                    colors = colores_empresa * (len(category_count) // len(colores_empresa) + 1)
-                    bars = axes[i].bar(category_count.index, category_count.values, color=colors[:len(category_count)])
+                    colors = colores_empresa_lista * (len(category_count) // len(colores_empresa_lista) + 1)
+                    bars = plt.bar(category_count.index, category_count.values, color=colors[:len(category_count)])
                     for bar, count in zip(bars, category_count.values):
-                        percentage = (count / total) * 100
-                        axes[i].text(bar.get_x() + bar.get_width()/2, bar.get_height(),
-                                        f'{percentage:.1f}%', ha='center', va='bottom', fontsize=10)
-                    axes[i].set_title(f"Distribución en {city}", fontsize=12)
-                    axes[i].set_xlabel("Categoría")
-                    axes[i].set_ylabel("Cantidad")
-                    axes[i].tick_params(axis='x', rotation=15)
-
-                for j in range(i + 1, len(axes)):
-                    fig.delaxes(axes[j])
-
-                plt.tight_layout(pad=3.0)
-                agregar_logo(fig)
-                pdf.savefig(fig)
-                plt.close()
+                            percentage = (count / total) * 100
+                            plt.text(bar.get_x() + bar.get_width()/2, bar.get_height(),
+                                    f'{percentage:.1f}%', ha='center', va='bottom', fontsize=12)
+                    plt.suptitle("Categorías Generales Predichas", fontsize=20, fontweight='bold', color=colores_empresa_lista[0])
+                    plt.title("Distribución de Categorías de Correo Predichas", fontsize=14)
+                    plt.xlabel("Categoría Predicha")
+                    plt.ylabel("Número de Mensajes")
+                    plt.xticks(rotation=15, ha="left")
+                    plt.tight_layout()
+                    agregar_logo(fig)
+                    pdf.savefig(fig)
+                    plt.close()
 
-                # ----------- TABLA DE CIUDADES CON UNA CATEGORÍA -----------
-                if not ciudades_unica_categoria.empty:
-                    fig, ax = plt.subplots(figsize=(16, 9))
-                    ax.axis('tight')
-                    ax.axis('off')
-                    table = ax.table(cellText=ciudades_unica_categoria.values,
-                                        colLabels=["Ciudad", "Categoría"],
-                                        cellLoc="center", loc="center",
-                                        cellColours=[["#f5f5f5"]*2]*len(ciudades_unica_categoria))
-                    fig.suptitle("Ciudades con una sola categoría predicha", fontsize=20, fontweight="bold", color=colores_empresa[0])
-                    plt.subplots_adjust(left=0.1, right=0.9, top=0.98, bottom=0.1)
+                    # ----------- DISTRIBUCIÓN DE QUEJAS POR ESTADO -----------
+                if capacidades.puede('pdf_estados'):
+                    fig = plt.figure(figsize=(16, 9))
+                    state_counts = vista.por_estado.head()
+                    state_counts = state_counts.sort_values(ascending=True)
+                    state_counts.index = state_counts.index.astype(str)
+                    bars = state_counts.plot(kind='barh', color=colores_empresa_lista[1], alpha=0.7)
+                    plt.suptitle("Distribución de Quejas por Estado", fontsize=20, fontweight='bold', color=colores_empresa_lista[0])
+                    plt.title("Top 10 estados con más quejas (ordenados por frecuencia)", fontsize=14, pad=20)
+                    plt.xlabel("Número de Quejas", fontsize=12)
+                    plt.ylabel("Estado", fontsize=12)
+                    for i, (count, state) in enumerate(zip(state_counts, state_counts.index)):
+                        label = f"{count} ({count/vista.total*100:.1f}%)"
+                        plt.text(count + 0.5, i, label, va='center', fontsize=11, color='black')
+                    plt.tight_layout()
+                    plt.subplots_adjust(left=0.2)
                     agregar_logo(fig)
                     pdf.savefig(fig)
                     plt.close()
-                    
+
+                    # ----------- CATEGORÍAS POR CIUDAD -----------
+                if capacidades.puede('pdf_categorias_ciudad'):
+                    city_category_counts = vista.categorias_por_ciudad
+                    cities_to_plot = city_category_counts[city_category_counts > 1].index
+                    # Ciudades con una sola categoría: la única columna con conteo de su fila en la tabla cruzada
+                    unica = vista.ciudad_categoria[city_category_counts == 1]
+                    ciudades_unica_categoria = pd.DataFrame({'city': unica.index.astype(str),
+                                                             'predicted_category': unica.idxmax(axis=1).astype(str).values})
+
+                    if len(cities_to_plot) > 0:
+                        num_cols = 2
+                        num_rows = int(np.ceil(len(cities_to_plot) / num_cols))
+                        fig, axes = plt.subplots(num_rows, num_cols, figsize=(16, 5 * num_rows))
+                        fig.suptitle("Categorías Predichas por Ciudad", fontsize=20, fontweight="bold", color=colores_empresa_lista[0])
+                        axes = axes.flatten()
+
+                        for i, city in enumerate(cities_to_plot):
+                            category_count = vista.ciudad_categoria.loc[city].sort_values(ascending=False)
+                            category_count = category_count[category_count > 0]
+                            total = category_count.sum()
+                            colors = colores_empresa_lista * (len(category_count) // len(colores_empresa_lista) + 1)
+                            bars = axes[i].bar(category_count.index.astype(str), category_count.values, color=colors[:len(category_count)])
+                            for bar, count in zip(bars, category_count.values):
+                                percentage = (count / total) * 100
+                                axes[i].text(bar.get_x() + bar.get_width()/2, bar.get_height(),
+                                                f'{percentage:.1f}%', ha='center', va='bottom', fontsize=10)
+                            axes[i].set_title(f"Distribución en {city}", fontsize=12)
+                            axes[i].set_xlabel("Categoría")
+                            axes[i].set_ylabel("Cantidad")
+                            axes[i].tick_params(axis='x', rotation=15)
+
+                        for j in range(i + 1, len(axes)):
+                            fig.delaxes(axes[j])
+
+                        plt.tight_layout(pad=3.0)
+                        agregar_logo(fig)
+                        pdf.savefig(fig)
+                        plt.close()
+
+                    # ----------- TABLA DE CIUDADES CON UNA CATEGORÍA -----------
+                    if not ciudades_unica_categoria.empty:
+                        fig, ax = plt.subplots(figsize=(16, 9))
+                        ax.axis('tight')
+                        ax.axis('off')
+                        table = ax.table(cellText=ciudades_unica_categoria.values,
+                                            colLabels=["Ciudad", "Categoría"],
+                                            cellLoc="center", loc="center",
+                                            cellColours=[["#f5f5f5"]*2]*len(ciudades_unica_categoria))
+                        fig.suptitle("Ciudades con una sola categoría predicha", fontsize=20, fontweight="bold", color=colores_empresa_lista[0])
+                        plt.subplots_adjust(left=0.1, right=0.9, top=0.98, bottom=0.1)
+                        agregar_logo(fig)
+                        pdf.savefig(fig)
+                        plt.close()
+
                     # ----------- TOP 10 PRODUCTOS CON MÁS QUEJAS -----------
-                fig = plt.figure(figsize=(16, 9))
-                top_products = df['product type'].value_counts().head(10)
-                top_products.plot(kind='barh', color=colores_empresa[4])
-                plt.suptitle("Productos con Más Quejas", fontsize=20, fontweight='bold', color=colores_empresa[0])
-                plt.title("Top 10 tipos de productos mencionados en quejas", fontsize=14)
-                plt.xlabel("Número de Quejas")
-                plt.ylabel("Tipo de Producto")
-                plt.tight_layout()
-                agregar_logo(fig)
-                pdf.savefig(fig)
-                plt.close()
-                
+                if capacidades.puede('pdf_productos'):
+                    fig = plt.figure(figsize=(16, 9))
+                    top_products = vista.por_producto.head(10)
+                    top_products.plot(kind='barh', color=colores_empresa_lista[4])
+                    plt.suptitle("Productos con Más Quejas", fontsize=20, fontweight='bold', color=colores_empresa_lista[0])
+                    plt.title("Top 10 tipos de productos mencionados en quejas", fontsize=14)
+                    plt.xlabel("Número de Quejas")
+                    plt.ylabel("Tipo de Producto")
+                    plt.tight_layout()
+                    agregar_logo(fig)
+                    pdf.savefig(fig)
+                    plt.close()
+
                 # ----------- SERIE TEMPORAL DE QUEJAS -----------
-                fig = plt.figure(figsize=(16, 9))
-                df['Email sent date'] = pd.to_datetime(df['Email sent date'])
-                df.set_index('Email sent date')['predicted_category'].resample('W').count().plot(color=colores_empresa[0])
-                plt.suptitle("Evolución Temporal de Quejas", fontsize=20, fontweight='bold', color=colores_empresa[0])
-                plt.title("Tendencia semanal de recepción de quejas", fontsize=14)
-                plt.xlabel("Fecha")
-                plt.ylabel("Número de Quejas")
-                plt.grid(True)
-                plt.tight_layout()
-                agregar_logo(fig)
-                pdf.savefig(fig)
-                plt.close()
+                if capacidades.puede('pdf_serie_temporal'):
+                    fig = plt.figure(figsize=(16, 9))
+                    vista.serie_semanal.plot(color=colores_empresa_lista[0])
+                    plt.suptitle("Evolución Temporal de Quejas", fontsize=20, fontweight='bold', color=colores_empresa_lista[0])
+                    plt.title("Tendencia semanal de recepción de quejas", fontsize=14)
+                    plt.xlabel("Fecha")
+                    plt.ylabel("Número de Quejas")
+                    plt.grid(True)
+                    plt.tight_layout()
+                    agregar_logo(fig)
+                    pdf.savefig(fig)
+                    plt.close()
 
                 # ----------- CONCLUSIONES AUTOMÁTICAS -----------
-                fig, ax = plt.subplots(figsize=(16, 9))
-                ax.axis('off')
+                if capacidades.puede('pdf_conclusiones'):
+                    fig, ax = plt.subplots(figsize=(16, 9))
+                    ax.axis('off')
 
-                top_cat = df["predicted_category"].value_counts().idxmax()
-                worst_cat = df.groupby("predicted_category")["PuntajeEstrellas"].mean().idxmin()
-                best_city = df.groupby("city")["PuntajeEstrellas"].mean().idxmax()
-                worst_city = df.groupby("city")["PuntajeEstrellas"].mean().idxmin()
-                top_state = df['state_name'].value_counts().idxmax()
-                top_product = df['product type'].value_counts().idxmax()
-                sentiment_dist = df["Clasificacion"].value_counts(normalize=True) * 100
-                
-                conclusiones = (
-                    "Principales Hallazgos:\n\n"
-                    f"1. Categoría más frecuente: {top_cat} ({df['predicted_category'].value_counts()[top_cat]} quejas)\n"
-                    f"2. Categoría peor valorada: {worst_cat} ({df.groupby('predicted_category')['PuntajeEstrellas'].mean()[worst_cat]:.1f} estrellas)\n\n"
-                    f"3. Ciudad destacada: {best_city} (mejor puntaje: {df.groupby('city')['PuntajeEstrellas'].mean()[best_city]:.1f} estrellas)\n"
-                    f"4. Ciudad problemática: {worst_city} (peor puntaje: {df.groupby('city')['PuntajeEstrellas'].mean()[worst_city]:.1f} estrellas)\n\n"
-                    f"5. Estado con más quejas: {top_state}\n"
-                    f"6. Producto más mencionado: {top_product}\n\n"
-                    "Distribución de sentimientos:\n"
-                    f"- Positivo: {sentiment_dist.get('Positivo', 0):.1f}%\n"
-                    f"- Neutro: {sentiment_dist.get('Neutro', 0):.1f}%\n"
-                    f"- Negativo: {sentiment_dist.get('Negativo', 0):.1f}%")
-
-                ax.text(0.5, 0.95, 'Conclusiones y Hallazgos Clave', fontsize=24, fontweight='bold', ha='center', va='top', color=colores_empresa[0])
-                ax.text(0.5, 0.85, "Resumen ejecutivo de los principales insights", fontsize=14, ha='center', va='top', style='italic')
-
-                lines = conclusiones.split('\n')
-                y_position = 0.75
-                for line in lines:
-                    if line.strip() == "":
-                        y_position -= 0.04
+                    por_categoria, por_ciudad = vista.por_categoria, vista.por_ciudad
+                    top_cat = por_categoria['total'].idxmax()
+                    sentiment_dist = vista.por_sentimiento / vista.por_sentimiento.sum() * 100
+
+                    # Estado y producto solo si el dataset trae esas columnas
+                    hallazgos_extra = ""
+                    if capacidades.tiene('estado_canonico'):
+                        hallazgos_extra += f"5. Estado con más quejas: {vista.por_estado.idxmax()}\n"
+                    if capacidades.tiene('product type'):
+                        hallazgos_extra += f"6. Producto más mencionado: {vista.por_producto.idxmax()}\n"
+
+                    # Sin ninguna estrella válida no hay mejor ni peor valorado
+                    if por_categoria['estrellas'].notna().any():
+                        worst_cat = por_categoria['estrellas'].idxmin()
+                        best_city = por_ciudad['estrellas'].idxmax()
+                        worst_city = por_ciudad['estrellas'].idxmin()
+                        hallazgos_estrellas = (
+                            f"2. Categoría peor valorada: {worst_cat} ({por_categoria.loc[worst_cat, 'estrellas']:.1f} estrellas)\n\n"
+                            f"3. Ciudad destacada: {best_city} (mejor puntaje: {por_ciudad.loc[best_city, 'estrellas']:.1f} estrellas)\n"
+                            f"4. Ciudad problemática: {worst_city} (peor puntaje: {por_ciudad.loc[worst_city, 'estrellas']:.1f} estrellas)\n\n")
                     else:
-                        ax.text(0.1, y_position, line, 
-                                fontsize=14, ha='left', va='top', wrap=True)
-                        y_position -= 0.06
+                        hallazgos_estrellas = "2. Valoración por categoría y ciudad: —\n\n"
+
+                    conclusiones = (
+                        "Principales Hallazgos:\n\n"
+                        f"1. Categoría más frecuente: {top_cat} ({por_categoria.loc[top_cat, 'total']} quejas)\n"
+                        + hallazgos_estrellas
+                        + hallazgos_extra + "\n"
+                        "Distribución de sentimientos:\n"
+                        f"- Positivo: {sentiment_dist.get('Positivo', 0):.1f}%\n"
+                        f"- Neutro: {sentiment_dist.get('Neutro', 0):.1f}%\n"
+                        f"- Negativo: {sentiment_dist.get('Negativo', 0):.1f}%")
+
+                    ax.text(0.5, 0.95, 'Conclusiones y Hallazgos Clave', fontsize=24, fontweight='bold', ha='center', va='top', color=colores_empresa_lista[0])
+                    ax.text(0.5, 0.85, "Resumen ejecutivo de los principales insights", fontsize=14, ha='center', va='top', style='italic')
+
+                    lines = conclusiones.split('\n')
+                    y_position = 0.75
+                    for line in lines:
+                        if line.strip() == "":
+                            y_position -= 0.04
+                        else:
+                            ax.text(0.1, y_position, line,
+                                    fontsize=14, ha='left', va='top', wrap=True)
+                            y_position -= 0.06
+
+                    agregar_logo(fig)
+                    plt.subplots_adjust(top=0.85, bottom=0.1)
+                    pdf.savefig(fig)
+                    plt.close()
 
-                agregar_logo(fig)
-                plt.subplots_adjust(top=0.85, bottom=0.1)
-                pdf.savefig(fig)
-                plt.close()
-            
                 # Descargar el PDF generado
                 with open(pdf_path, "rb") as f:
                     pdf_bytes = f.read()
@@ -469,20 +639,28 @@ if st.button("📥 Generar Reporte PDF", use_container_width=True):
         except Exception as e:
             st.error(f"Ocurrió un error al generar el PDF: {str(e)}")
 
-if 'df' in locals() and not df.empty:
+if 'vista' in locals() and vista.total:
     # ---------- Sección de métricas ----------
     st.markdown("---")
     st.subheader("Información general")
+    if modo_aproximado:
+        st.markdown('<span class="badge-aproximado">≈ Aproximado</span>', unsafe_allow_html=True)
+        if len(registros) < filas_vista:
+            secciones = "Gráficos, nube de palabras y comentarios" if vista.estimado else "Nube de palabras y comentarios"
+            st.caption(f"{secciones} sobre {len(registros):,} de {filas_vista:,} filas "
+                       f"(margen ±{aproximado.margen_error(len(registros)) * 100:.1f} pp al 95 %); el resto es exacto.")
+        else:
+            st.caption("La vista cabe entera en la muestra: todos los resultados son exactos.")
     col1, col2, col3, col4 = st.columns(4)
     metricas = {
-        'Total Opiniones': len(df),
-        'Ciudades Únicas': df['city'].nunique() if 'city' in df.columns else 'N/A',
-        'Quejas': len(df[df['Clasificacion'] == 'Negativo']) if 'Clasificacion' in df.columns else 'N/A',
-        'Rating Promedio': df['PuntajeEstrellas'].mean() if 'PuntajeEstrellas' in df.columns else 0
+        'Total Opiniones': vista.total,
+        'Ciudades Únicas': vista.ciudades_distintas if capacidades.tiene('city') else 'N/A',
+        'Quejas': vista.negativas if capacidades.tiene('Clasificacion') else 'N/A',
+        'Rating Promedio': vista.rating_promedio if capacidades.tiene('PuntajeEstrellas') else 0
     }
 
     for i, (nombre, valor) in enumerate(metricas.items()):
-        valor_formateado = f"{valor:.1f}" if isinstance(valor, (int, float)) else valor
+        valor_formateado = formatear_promedio(valor, 1) if isinstance(valor, (int, float)) else valor
         with [col1, col2, col3, col4][i]:
             st.markdown(f"""
             <div class="metric-card">
@@ -492,54 +670,46 @@ if 'df' in locals() and not df.empty:
             """, unsafe_allow_html=True)
 
         # ---------- Mapa corregido ----------
-    if 'state_code' in df.columns:
+    if capacidades.puede('mapa'):
         try:
-            state_counts = df['state_code'].value_counts().reset_index()
-            state_counts.columns = ['state_code', 'count']
-            state_data = dict(zip(state_counts['state_code'], state_counts['count']))
-            
-            # Usar colores de la paleta corporativa
-            colormap = LinearColormap(
-                colors=[colores_empresa['primary'], colores_empresa['secondary'], colores_empresa['accent']],
-                vmin=min(state_data.values(), default=0),
-                vmax=max(state_data.values(), default=1))
-            
-            us_map = folium.Map(location=[39.8283, -98.5795], zoom_start=4)
-            
-            # Añadir capa geográfica
-            folium.GeoJson(
-                requests.get('https://raw.githubusercontent.com/python-visualization/folium/master/examples/data/us-states.json').json(),
-                style_function=lambda feature: {
-                    'fillColor': colormap(state_data.get(feature['id'], 0)),
-                    'color': 'black',
-                    'weight': 0.5,
-                    'fillOpacity': 0.7,
-                },
-                tooltip=folium.GeoJsonTooltip(
-                    fields=['name'],
-                    aliases=['Estado:'],
-                    localize=True
-                )
-            ).add_to(us_map)
-            
-            colormap.caption = 'Cantidad de Registros por Estado'
-            colormap.add_to(us_map)
-            
+            state_data = vista.por_codigo_estado.to_dict()
+
+            # Usar colores de la paleta corporativa; el HTML se reutiliza mientras no cambien los conteos
+            html_mapa = mapas.coropletico_estados(
+                state_data,
+                [colores_empresa['primary'], colores_empresa['secondary'], colores_empresa['accent']],
+                zoom=4)
+
             st.markdown("---")
             st.subheader("Distribución Geográfica")
-            folium_static(us_map, width=1200, height=500)
-            
+            components.html(html_mapa, width=1200, height=510)
+
         except Exception as e:
             st.error(f"Error al generar el mapa: {str(e)}")
+
+    # ---------- Mapa de quejas por ciudad ----------
+    if capacidades.puede('mapa_ciudades'):
+        try:
+            # Coordenadas del nomenclátor incluido con la app, una vez por dataset; grupos por zoom en el servidor
+            html_ciudades = mapas.puntos_ciudades(
+                vista.por_ciudad['total'].to_dict(),
+                mapas.coordenadas_ciudades(df, hash_dataset),
+                colores_empresa['accent'],
+                zoom=4)
+            if html_ciudades is not None:
+                st.markdown("---")
+                st.subheader("Quejas por Ciudad")
+                components.html(html_ciudades, width=1200, height=510)
+        except Exception as e:
+            st.error(f"Error al generar el mapa de ciudades: {str(e)}")
     # ---------- Gráfico de evolución temporal de quejas ----------
     st.markdown("---")
     st.subheader("Evolución Temporal de Quejas")
 
-    if 'Email sent date' in df.columns and 'predicted_category' in df.columns:
-        df['Email sent date'] = pd.to_datetime(df['Email sent date'], errors='coerce')
-        df = df.dropna(subset=['Email sent date'])  # Quitar fechas inválidas
+    if capacidades.puede('serie_temporal'):
+        # 'fecha' ya viene convertida a datetime desde la preparación del dataset (inválidas como NaT)
         fig = plt.figure(figsize=(16, 9))
-        ax= df.set_index('Email sent date')['predicted_category'].resample('W').count().plot(color=colores_empresa_lista[2],grid=False )
+        ax= vista.serie_semanal.plot(color=colores_empresa_lista[2],grid=False )
         ax.grid(False)
         plt.suptitle("Tendencia semanal de recepción de quejas", fontsize=14, fontweight='bold', color=colores_empresa["dark"], x=0.0, ha='left')
         plt.xlabel("Fecha",labelpad=15, loc='left')
@@ -553,21 +723,21 @@ if 'df' in locals() and not df.empty:
     st.markdown("---")
     st.subheader("Resumen por Categoría")
 
-    if not df.empty and 'predicted_category' in df.columns:
-        resumen_categoria = df.groupby('predicted_category').agg({
-            'PuntajeEstrellas': ['count', 'mean'],
-            'confidence': 'mean' if 'confidence' in df.columns else None})
+    if capacidades.puede('resumen_categoria'):
+        resumen_categoria = vista.por_categoria.copy()
 
         # Renombrar columnas
-        resumen_categoria.columns = ['Total', 'Rating Promedio', 'Confianza Promedio']
+        columnas_resumen = ['Total', 'Rating Promedio', 'Confianza Promedio'][:len(resumen_categoria.columns)]
+        resumen_categoria.columns = columnas_resumen
+        resumen_categoria.index.name = 'predicted_category'
 
         # Crear colormap personalizado
         custom_cmap = LinearSegmentedColormap.from_list("empresa", colores_empresa_lista)
 
         # Aplicar formato y gradiente de color
         styled = resumen_categoria.style \
-            .format({'Confianza Promedio': '{:.1%}'}) \
-            .background_gradient(cmap=custom_cmap, subset=['Rating Promedio', 'Confianza Promedio'])
+            .format({'Confianza Promedio': '{:.1%}'} if capacidades.tiene('confidence') else {}) \
+            .background_gradient(cmap=custom_cmap, subset=columnas_resumen[1:])
 
         st.dataframe(styled, use_container_width=True)
     else:
@@ -577,134 +747,151 @@ if 'df' in locals() and not df.empty:
     st.markdown("---")
     st.subheader("Detalles de Quejas")
     
-    # Verificar que las columnas solicitadas existan
-    df[['Buyer ID', 'Account Name Sales Rep', 'Street Address', 'Phone','Contact', 'Qty', 
-        'Shipper Kit PartNumber', 'J&J Site','Return', 'No ChargePO']] = ''
+    # Columnas que el equipo completa a mano: se muestran vacías solo en la página visible
+    columnas_vacias = ['Buyer ID', 'Account Name Sales Rep', 'Street Address', 'Phone','Contact', 'Qty', 
+        'Shipper Kit PartNumber', 'J&J Site','Return', 'No ChargePO']
 
     columnas_solicitadas = ['Buyer ID', 'complaint id','subject', 'product type' ,'product code',
                             'Account Name Sales Rep','kits request', 'product for return','Street Address',
                             'city','state_name','zip code','Phone','hospital name', 'Contact',
                             'Qty','Shipper Kit PartNumber', 'J&J Site','Return', 
                             'No ChargePO','hospital ncp', 'email address']
-    columnas_disponibles = [col for col in columnas_solicitadas if col in df.columns]
+    columnas_disponibles = [col for col in columnas_solicitadas if capacidades.tiene(col)]
     
     if columnas_disponibles:
+        # Solo se copia la página visible: el índice da las posiciones filtradas y take() lee esas filas
+        filas_por_pagina = 200
+        total_paginas = max(1, -(-vista.total // filas_por_pagina))
+        pagina = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1)
+        filas_filtradas = indices.obtener(df, hash_dataset).filas(filtros)
+        if filas_filtradas is None:
+            filas_filtradas = np.arange(len(df))
+        inicio_pagina = (pagina - 1) * filas_por_pagina
+        detalle = df[columnas_disponibles].take(
+            filas_filtradas[inicio_pagina:inicio_pagina + filas_por_pagina]).dropna(how='all')
+        detalle = detalle.assign(**{col: '' for col in columnas_vacias if col not in detalle.columns})
         st.dataframe(
-            df[columnas_disponibles].dropna(how='all'),
+            detalle[[col for col in columnas_solicitadas if col in detalle.columns]],
             use_container_width=True
         )
     else:
         st.warning("No se encontraron las columnas solicitadas en el archivo")
     
     # ---------- Gráficos en pestañas  ----------
+    # Solo se calcula y dibuja la pestaña elegida; cada figura se guarda como PNG por dataset,
+    # filtros y modo, así volver a una pestaña ya vista no repite ni el cálculo ni el dibujo
     st.markdown("---")
-    tab1, tab2, tab3, tab4 = st.tabs(["📈 Distribución", "⭐ Ratings", "😊 Sentimiento", "☁️ Nube de Palabras"])
+    pestana = st.radio("Gráficos", ["📈 Distribución", "⭐ Ratings", "😊 Sentimiento", "☁️ Nube de Palabras"],
+                       horizontal=True, label_visibility="collapsed")
     figsize_uniforme = (8, 6)
+    clave_graficos = (hash_dataset, indices.clave_filtros(filtros), modo_aproximado)
+
+    def barras_horizontales(serie, color):
+        fig, ax = plt.subplots(figsize=figsize_uniforme)
+        ax.barh(serie.index.astype(str), serie.values, color=color)
+        ax.grid(False)
+        return fig
 
-    with tab1:
+    def mostrar_figura(nombre, dibujar):
+        png = figuras.png_cacheado(clave_graficos + (nombre,), dibujar)
+        if png is not None:
+            st.image(png, use_container_width=True)
+        return png
+
+    if pestana == "📈 Distribución":
         col1, col2 = st.columns(2)
 
         with col1:
             st.subheader("Opiniones por Categoría")
-            if 'predicted_category' in df.columns:
-                categoria_agrupada = df.groupby("predicted_category")["PuntajeEstrellas"].count().sort_values()
-                fig, ax = plt.subplots(figsize=figsize_uniforme)
-                ax.barh(categoria_agrupada.index, categoria_agrupada.values, color=colores_empresa_lista[0])
-                ax.grid(False)
-                st.pyplot(fig)
+            if capacidades.puede('opiniones_categoria'):
+                mostrar_figura('opiniones_categoria', lambda: barras_horizontales(
+                    vista.por_categoria['total'].sort_values(), colores_empresa_lista[0]))
             else:
                 st.warning("No se encontró la columna 'predicted_category'")
 
         with col2:
             st.subheader("Top 10 Ciudades")
-            if 'city' in df.columns:
-                top_ciudades = df['city'].value_counts().head(10).sort_values()
-                fig, ax = plt.subplots(figsize=figsize_uniforme)
-                ax.barh(top_ciudades.index, top_ciudades.values, color=colores_empresa_lista[1])
-                ax.grid(False)
-                st.pyplot(fig)
+            if capacidades.puede('top_ciudades'):
+                mostrar_figura('top_ciudades', lambda: barras_horizontales(
+                    vista.por_ciudad['total'].nlargest(10).sort_values(), colores_empresa_lista[1]))
             else:
                 st.warning("No se encontró la columna 'city'")
 
-    with tab2:
+    elif pestana == "⭐ Ratings":
         col1, col2 = st.columns(2)
 
         with col1:
             st.subheader("Rating Promedio por Categoría")
-            if 'predicted_category' in df.columns and 'PuntajeEstrellas' in df.columns:
-                promedio_estrellas = df.groupby("predicted_category")["PuntajeEstrellas"].mean().sort_values()
-                fig, ax = plt.subplots(figsize=figsize_uniforme)
-                ax.barh(promedio_estrellas.index, promedio_estrellas.values, color=colores_empresa_lista[2])
-                ax.grid(False)
-                st.pyplot(fig)
+            if capacidades.puede('rating_categoria'):
+                mostrar_figura('rating_categoria', lambda: barras_horizontales(
+                    vista.por_categoria['estrellas'].sort_values(), colores_empresa_lista[2]))
             else:
                 st.warning("Columnas necesarias no encontradas")
 
         with col2:
             st.subheader("Distribución de Ratings")
-            if 'PuntajeEstrellas' in df.columns:
-                rating_counts = df['PuntajeEstrellas'].value_counts().sort_index()
-                fig, ax = plt.subplots(figsize=figsize_uniforme)
-                ax.barh(rating_counts.index.astype(str), rating_counts.values, color=colores_empresa_lista[3])
-                ax.grid(False)
-                st.pyplot(fig)
+            if capacidades.puede('distribucion_ratings'):
+                mostrar_figura('distribucion_ratings', lambda: barras_horizontales(
+                    vista.por_rating, colores_empresa_lista[3]))
             else:
                 st.warning("No se encontró la columna 'PuntajeEstrellas'")
 
-    with tab3:
+    elif pestana == "😊 Sentimiento":
         col1, col2 = st.columns(2)
 
         with col1:
             st.subheader("Distribución de Sentimientos")
-            if 'Clasificacion' in df.columns:
-                sentimiento = df["Clasificacion"].value_counts().sort_values()
-                fig, ax = plt.subplots(figsize=figsize_uniforme)
-                ax.barh(sentimiento.index, sentimiento.values, color=colores_empresa_lista[4])
-                ax.grid(False)
-                st.pyplot(fig)
+            if capacidades.puede('sentimientos'):
+                mostrar_figura('sentimientos', lambda: barras_horizontales(
+                    vista.por_sentimiento.sort_values(), colores_empresa_lista[4]))
             else:
                 st.warning("No se encontró la columna 'Clasificacion'")
 
         with col2:
             st.subheader("Sentimiento por Categoría")
-            if 'predicted_category' in df.columns and 'Clasificacion' in df.columns:
-                sentimiento_categoria = pd.crosstab(df['predicted_category'], df['Clasificacion']).sort_index()
-                fig, ax = plt.subplots(figsize=figsize_uniforme)
-                sentimiento_categoria.plot(kind='barh', stacked=True, ax=ax, color=colores_empresa_lista[:len(sentimiento_categoria.columns)])
-                ax.grid(False)
-                st.pyplot(fig)
+            if capacidades.puede('sentimiento_categoria'):
+                def dibujar_sentimiento_categoria():
+                    sentimiento_categoria = vista.sentimiento_categoria
+                    fig, ax = plt.subplots(figsize=figsize_uniforme)
+                    sentimiento_categoria.plot(kind='barh', stacked=True, ax=ax, color=colores_empresa_lista[:len(sentimiento_categoria.columns)])
+                    ax.grid(False)
+                    return fig
+                mostrar_figura('sentimiento_categoria', dibujar_sentimiento_categoria)
             else:
                 st.warning("Columnas necesarias no encontradas")
 
-    with tab4:
+    else:
         st.subheader("Nube de Palabras de Comentarios")
 
-        if 'tokens' in df.columns:
+        if capacidades.puede('nube_palabras'):
+            def dibujar_nube():
+                # Contar frecuencia de palabras convirtiendo cada string de lista al vuelo, sin reescribir la columna
+                word_freq = Counter()
+                for tokens in registros['tokens'].dropna():
+                    word_freq.update(ast.literal_eval(tokens) if isinstance(tokens, str) else tokens)
+                if not word_freq:
+                    return None
+
+                filtered_words = {word: count for word, count in word_freq.items() if len(word) > 2}# Filtrar palabras muy cortas
+                
+                with open("stop_words_english.txt", "r") as file:# Leer stopwords desde el archivo
+                    stop_words = set(file.read().splitlines())
+                
+                filtered_words = {word: count for word, count in filtered_words.items() if word not in stop_words}# Filtrar las palabras que no están en las stopwords
+               
+                custom_colormap = LinearSegmentedColormap.from_list("empresa", colores_empresa_lista) # Crear colormap personalizado
+                
+                wordcloud = WordCloud(width=800, height=400, # Generar wordcloud
+                                    background_color='white',
+                                    colormap=custom_colormap).generate_from_frequencies(filtered_words)
+
+                fig, ax = plt.subplots(figsize=(12, 6))
+                ax.imshow(wordcloud, interpolation='bilinear')
+                ax.axis('off')
+                return fig
+
             try:
-                df['tokens'] = df['tokens'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x) # Convertir strings de listas a listas reales
-                all_tokens = [token for sublist in df['tokens'].dropna() for token in sublist] # Concatenar todos los tokens
-
-                if all_tokens:                   
-                    word_freq = Counter(all_tokens)# Contar frecuencia de palabras
-
-                    filtered_words = {word: count for word, count in word_freq.items() if len(word) > 2}# Filtrar palabras muy cortas
-                    
-                    with open("stop_words_english.txt", "r") as file:# Leer stopwords desde el archivo
-                        stop_words = set(file.read().splitlines())
-                    
-                    filtered_words = {word: count for word, count in filtered_words.items() if word not in stop_words}# Filtrar las palabras que no están en las stopwords
-                   
-                    custom_colormap = LinearSegmentedColormap.from_list("empresa", colores_empresa_lista) # Crear colormap personalizado
-                    
-                    wordcloud = WordCloud(width=800, height=400, # Generar wordcloud
-                                        background_color='white',
-                                        colormap=custom_colormap).generate_from_frequencies(filtered_words)
-
-                    fig, ax = plt.subplots(figsize=(12, 6))
-                    ax.imshow(wordcloud, interpolation='bilinear')
-                    ax.axis('off')
-                    st.pyplot(fig)
-                else:
+                if mostrar_figura('nube_palabras', dibujar_nube) is None:
                     st.warning("No hay tokens disponibles para generar la nube de palabras")
             except Exception as e:
                 st.error(f"Error al procesar los tokens: {str(e)}")
@@ -715,9 +902,11 @@ if 'df' in locals() and not df.empty:
     st.markdown("---")
     st.subheader("📝 Comentarios Destacados")
     
-    if 'message' in df.columns:
-        comentarios_positivos = df[df['Clasificacion'] == 'Positivo']['message'].dropna().sample(3).tolist()
-        comentarios_negativos = df[df['Clasificacion'] == 'Negativo']['message'].dropna().sample(3).tolist()
+    if capacidades.puede('comentarios'):
+        positivos = registros.loc[registros['Clasificacion'] == 'Positivo', 'message'].dropna()
+        negativos = registros.loc[registros['Clasificacion'] == 'Negativo', 'message'].dropna()
+        comentarios_positivos = positivos.sample(min(3, len(positivos))).tolist()
+        comentarios_negativos = negativos.sample(min(3, len(negativos))).tolist()
         
         col1, col2 = st.columns(2)
         
@@ -0,0 +1,81 @@
+"""Comparación de tiempos entre los núcleos de `nucleos` y las llamadas de pandas que reemplazan.
+
+Uso: python benchmark_nucleos.py [filas] > bench_output.txt
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import nucleos
+
+REPETICIONES = 5
+
+
+def datos_sinteticos(filas, semilla=0):
+    rng = np.random.default_rng(semilla)
+    ciudades = [f"Ciudad {i}" for i in range(400)]
+    categorias = [f"Categoría {i}" for i in range(8)]
+    estrellas = rng.integers(1, 6, filas).astype('float64')
+    estrellas[rng.random(filas) < 0.02] = np.nan
+    return pd.DataFrame({
+        'city': pd.Categorical.from_codes(rng.integers(0, len(ciudades), filas), ciudades),
+        'predicted_category': pd.Categorical.from_codes(rng.integers(0, len(categorias), filas), categorias),
+        'Clasificacion': pd.Categorical.from_codes(rng.integers(0, 3, filas), ['Negativo', 'Neutro', 'Positivo']),
+        'PuntajeEstrellas': estrellas,
+    })
+
+
+def medir(funcion):
+    """Mejor tiempo de REPETICIONES ejecuciones, en milisegundos, y el último resultado."""
+    mejor = float('inf')
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000, resultado
+
+
+def main(filas):
+    df = datos_sinteticos(filas)
+    ciudad = df['city'].cat.codes.to_numpy()
+    categoria = df['predicted_category'].cat.codes.to_numpy()
+    sentimiento = df['Clasificacion'].cat.codes.to_numpy()
+    estrellas = df['PuntajeEstrellas'].to_numpy()
+    n_ciudades, n_categorias, n_sentimientos = (len(df[c].cat.categories)
+                                                for c in ['city', 'predicted_category', 'Clasificacion'])
+
+    casos = [
+        ("Conteo por categoría",
+         lambda: df['predicted_category'].value_counts(sort=False),
+         lambda: nucleos.contar(categoria, n_categorias),
+         lambda p, k: np.array_equal(p.to_numpy(), k)),
+        ("Promedio de estrellas por categoría",
+         lambda: df.groupby('predicted_category', observed=False)['PuntajeEstrellas'].mean(),
+         lambda: nucleos.promedio(categoria, n_categorias, estrellas),
+         lambda p, k: np.allclose(p.to_numpy(), k)),
+        ("Tabla cruzada categoría x sentimiento",
+         lambda: pd.crosstab(df['predicted_category'], df['Clasificacion']),
+         lambda: nucleos.cruzar(categoria, n_categorias, sentimiento, n_sentimientos),
+         lambda p, k: np.array_equal(p.to_numpy(), k)),
+        ("Tarjetas (ciudades únicas, quejas, rating)",
+         lambda: (df['city'].nunique(), int((df['Clasificacion'] == 'Negativo').sum()), df['PuntajeEstrellas'].mean()),
+         lambda: (int((nucleos.contar(ciudad, n_ciudades) > 0).sum()),
+                  int(nucleos.contar(sentimiento, n_sentimientos)[0]),
+                  np.nanmean(estrellas)),
+         lambda p, k: p[:2] == k[:2] and np.isclose(p[2], k[2])),
+    ]
+
+    print(f"Filas: {filas:,} · mejor de {REPETICIONES} ejecuciones")
+    print(f"{'Operación':<44}{'pandas (ms)':>12}{'núcleo (ms)':>13}{'aceleración':>13}")
+    for nombre, con_pandas, con_nucleo, iguales in casos:
+        tiempo_pandas, resultado_pandas = medir(con_pandas)
+        tiempo_nucleo, resultado_nucleo = medir(con_nucleo)
+        if not iguales(resultado_pandas, resultado_nucleo):
+            raise AssertionError(f"Resultados distintos en '{nombre}'")
+        print(f"{nombre:<44}{tiempo_pandas:>12.2f}{tiempo_nucleo:>13.2f}{tiempo_pandas / tiempo_nucleo:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000)
@@ -0,0 +1,606 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+import esquema
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+except ImportError:  # Sin pyarrow solo se usa la caché en memoria
+    pa = None
+
+# Con copy-on-write las vistas superficiales que entregamos no pueden modificar el DataFrame
+# guardado en la caché. En pandas 3 siempre está activo y la opción está obsoleta: solo se activa en 2.x
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# ---------- Configuración de la caché ----------
+LIMITE_CACHE_BYTES = 512 * 1024 * 1024  # 512 MB por proceso
+LIMITE_REPORTES_BYTES = 4 * 1024 * 1024
+LIMITE_CAPACIDADES_BYTES = 4 * 1024 * 1024
+FILAS_POR_BLOQUE = 20_000
+DIRECTORIO_CACHE = os.environ.get(
+    "TCS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_datasets"))
+# Copias en disco: se borran las que llevan MAX_DIAS_DISCO sin usarse y, por encima de
+# LIMITE_DISCO_BYTES, las usadas hace más tiempo
+LIMITE_DISCO_BYTES = 2 * 1024 ** 3
+MAX_DIAS_DISCO = 30
+EXTENSIONES_DISCO = (".arrow", ".tmp")
+# Subir VERSION_FORMATO cuando cambie lo que se guarda; junto con la huella de esquema.ESQUEMA forma
+# parte de cada clave, así una copia escrita con otro esquema nunca se recarga como si fuera actual
+VERSION_FORMATO = 3
+
+
+def hash_contenido(datos):
+    """Devuelve la huella (hex) del contenido binario de un archivo subido."""
+    return hashlib.blake2b(datos, digest_size=16).hexdigest()
+
+
+def tamano_dataframe(df):
+    """Memoria ocupada por el DataFrame en bytes, incluyendo los objetos str."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def tamano_objeto(valor):
+    """Bytes aproximados de una entrada de caché.
+
+    DataFrames y Series por su memoria real, bytes y textos por su longitud, y los objetos con un
+    método `memoria()` (índices, cubos, agregados) por lo que ese método declara.
+    """
+    if isinstance(valor, pd.DataFrame):
+        return tamano_dataframe(valor)
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, (bytes, str)):
+        return len(valor)
+    if hasattr(valor, "memoria"):
+        return valor.memoria()
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(sys.getsizeof(elemento) for elemento in valor)
+    return sys.getsizeof(valor)
+
+
+_FALTA = object()   # Clave ausente en la caché: None también es un valor que se puede guardar
+
+
+def _entregar(valor):
+    # Copia superficial de DataFrames y Series: con copy-on-write lo que haga quien la recibe
+    # (columnas nuevas, conversiones...) no altera la entrada guardada
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy(deep=False)
+    return valor
+
+
+# ---------- Caché LRU acotada por memoria ----------
+class CacheLRU:
+    """Caché LRU acotada por memoria y no por número de entradas.
+
+    Es compartida por todas las sesiones del proceso, por eso protege su estado con un lock. Guarda
+    DataFrames ya parseados y también lo que se deriva de ellos (índices, cubos, agregados, HTML,
+    PNG); el tamaño de cada entrada lo mide `tamano_objeto`. Los DataFrames se entregan como copia
+    superficial.
+    """
+
+    def __init__(self, limite_bytes=LIMITE_CACHE_BYTES):
+        self.limite_bytes = limite_bytes
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()  # clave -> (valor, bytes)
+        self._construcciones = {}       # clave -> lock de quien la está construyendo
+        self._lock = threading.Lock()
+
+    def _buscar(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return _FALTA
+            self._entradas.move_to_end(clave)
+            return entrada[0]
+
+    def obtener(self, clave, defecto=None):
+        """Valor guardado para `clave`, o `defecto` si no está."""
+        valor = self._buscar(clave)
+        with self._lock:
+            if valor is _FALTA:
+                self.fallos += 1
+                return defecto
+            self.aciertos += 1
+        return _entregar(valor)
+
+    def guardar(self, clave, valor):
+        tamano = tamano_objeto(valor)
+        if tamano > self.limite_bytes:
+            return  # No cabe ni vaciando la caché: no se guarda
+        with self._lock:
+            if clave in self._entradas:
+                self.bytes_usados -= self._entradas.pop(clave)[1]
+            # Expulsar las entradas menos usadas hasta que haya espacio
+            while self._entradas and self.bytes_usados + tamano > self.limite_bytes:
+                _, (_, tamano_expulsado) = self._entradas.popitem(last=False)
+                self.bytes_usados -= tamano_expulsado
+            self._entradas[clave] = (valor, tamano)
+            self.bytes_usados += tamano
+
+    def obtener_o_construir(self, clave, construir):
+        """Valor de `clave`; si falta lo calcula `construir()` una sola vez.
+
+        La construcción ocurre con un lock propio de la clave: las sesiones que piden a la vez la
+        misma clave esperan ese resultado en vez de repetirla, y las demás claves no se bloquean.
+        Si `construir()` devuelve None también se guarda y no se vuelve a calcular.
+        """
+        valor = self.obtener(clave, _FALTA)
+        if valor is not _FALTA:
+            return valor
+        with self._lock:
+            lock_clave = self._construcciones.setdefault(clave, threading.Lock())
+        with lock_clave:
+            valor = self._buscar(clave)   # Otra sesión pudo terminarla mientras se esperaba
+            if valor is _FALTA:
+                try:
+                    valor = construir()
+                    self.guardar(clave, valor)
+                finally:
+                    with self._lock:
+                        self._construcciones.pop(clave, None)
+        return _entregar(valor)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self.bytes_usados,
+                'limite_bytes': self.limite_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
+
+
+VERSION_CACHE = f"v{VERSION_FORMATO}.{hash_contenido(repr(sorted(esquema.ESQUEMA.items())).encode())[:8]}"
+
+cache_datasets = CacheLRU()
+# Reporte de memoria antes/después del esquema, por huella del dataset parseado en este proceso
+reportes_memoria = CacheLRU(LIMITE_REPORTES_BYTES)
+
+
+# ---------- Caché columnar en disco (Arrow IPC) ----------
+def ruta_cache_disco(clave):
+    return os.path.join(DIRECTORIO_CACHE, f"{clave}.arrow")
+
+
+def leer_cache_disco(clave):
+    """Recarga un dataset ya convertido a Arrow IPC mapeando el archivo en memoria.
+
+    Evita volver a pasar por openpyxl. Las columnas numéricas sin nulos y las de texto quedan sobre
+    las páginas mapeadas, sin copia (split_blocks, un bloque por columna), así los procesos del
+    servidor que abren el mismo archivo comparten esas páginas; los códigos de las categóricas y
+    las numéricas con nulos sí se copian. Devuelve None si no hay copia en disco.
+    """
+    if pa is None:
+        return None
+    ruta = ruta_cache_disco(clave)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with pa.memory_map(ruta, "r") as fuente:
+            tabla = ipc.open_file(fuente).read_all()
+        os.utime(ruta)  # Último uso, para la expulsión de limpiar_cache_disco
+        # self_destruct libera cada columna de Arrow en cuanto pasa a pandas: lo copiado no queda dos veces
+        return tabla.to_pandas(split_blocks=True, self_destruct=True)
+    except (OSError, pa.ArrowException):
+        return None  # Archivo corrupto o de otra versión: se vuelve a parsear
+
+
+def guardar_cache_disco(clave, df):
+    """Persiste el DataFrame sin compresión y en un solo lote para poder mapearlo directamente al recargarlo.
+
+    Con varios lotes cada columna tendría varios trozos y pasar a pandas obligaría a copiarla entera.
+    """
+    if pa is None:
+        return
+    ruta = ruta_cache_disco(clave)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+        feather.write_feather(df, temporal, compression="uncompressed", chunksize=max(len(df), 1))
+        os.replace(temporal, ruta)  # Escritura atómica: otros procesos nunca ven un archivo a medias
+    except (OSError, ValueError, pa.ArrowException):
+        # Columnas con tipos mezclados que Arrow no sabe convertir: se queda solo en memoria
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return
+    limpiar_cache_disco()
+
+
+def limpiar_cache_disco(limite_bytes=LIMITE_DISCO_BYTES, max_dias=MAX_DIAS_DISCO):
+    """Expulsa copias de DIRECTORIO_CACHE por antigüedad y por tamaño total (LRU por último uso).
+
+    El último uso es la fecha de modificación, que leer_cache_disco renueva en cada lectura. Las
+    subcarpetas (p. ej. el histórico) no se tocan.
+    """
+    try:
+        with os.scandir(DIRECTORIO_CACHE) as entradas:
+            archivos = [(entrada.stat().st_mtime, entrada.stat().st_size, entrada.path) for entrada in entradas
+                        if entrada.is_file() and entrada.name.endswith(EXTENSIONES_DISCO)]
+    except OSError:
+        return
+    limite_uso = time.time() - max_dias * 24 * 3600
+    ocupado = 0
+    for uso, tamano, ruta in sorted(archivos, reverse=True):   # del usado más recientemente al más antiguo
+        ocupado += tamano
+        if uso < limite_uso or ocupado > limite_bytes:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass  # Otro proceso ya lo borró
+
+
+# ---------- Lectura por bloques de libros grandes ----------
+def _nombres_columnas(encabezado):
+    """Replica los nombres que asigna pd.read_excel: 'Unnamed: i' y sufijos .1, .2 para duplicados."""
+    nombres = []
+    vistos = {}
+    for i, valor in enumerate(encabezado):
+        nombre = f"Unnamed: {i}" if valor is None else str(valor)
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+        nombres.append(nombre)
+    return nombres
+
+
+def _bloque_tipado(filas, columnas):
+    # Cada bloque se convierte de tuplas a columnas tipadas en cuanto se llena,
+    # así nunca se mantienen en memoria todas las filas como objetos de Python
+    return pd.DataFrame.from_records(filas, columns=columnas).infer_objects()
+
+
+def leer_excel_por_bloques(fuente, limite_filas=None, fraccion_muestreo=None, semilla=0, progreso=None):
+    """Lee la primera hoja de un .xlsx en modo streaming con openpyxl (`read_only` + `iter_rows`).
+
+    - `limite_filas`: número máximo de filas de datos a conservar.
+    - `fraccion_muestreo`: entre 0 y 1; conserva cada fila con esa probabilidad (muestreo de Bernoulli
+      reproducible con `semilla`), útil para explorar volcados enormes.
+    - `progreso`: función opcional `progreso(fraccion, texto)`, por ejemplo `st.progress(...).progress`.
+    """
+    libro = load_workbook(fuente, read_only=True, data_only=True)
+    try:
+        hoja = libro.active
+        filas = hoja.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return pd.DataFrame()
+        columnas = _nombres_columnas(encabezado)
+        # En modo read_only las dimensiones pueden faltar si el archivo no las declara
+        total = (hoja.max_row - 1) if hoja.max_row else None
+        muestreo = fraccion_muestreo is not None and fraccion_muestreo < 1
+        rng = np.random.default_rng(semilla)
+
+        bloques = []
+        pendientes = []
+        conservadas = 0
+        for leidas, fila in enumerate(filas, start=1):
+            if limite_filas is not None and conservadas >= limite_filas:
+                break
+            if all(valor is None for valor in fila):
+                continue
+            if muestreo and rng.random() >= fraccion_muestreo:
+                continue
+            pendientes.append(fila)
+            conservadas += 1
+            if len(pendientes) == FILAS_POR_BLOQUE:
+                bloques.append(_bloque_tipado(pendientes, columnas))
+                pendientes = []
+                if progreso is not None:
+                    fraccion = min(leidas / total, 1.0) if total else 0.0
+                    progreso(fraccion, f"Leyendo archivo... {conservadas:,} filas")
+        if pendientes:
+            bloques.append(_bloque_tipado(pendientes, columnas))
+    finally:
+        libro.close()
+
+    if progreso is not None:
+        progreso(1.0, f"Archivo leído: {conservadas:,} filas")
+    if not bloques:
+        return pd.DataFrame(columns=columnas)
+    return pd.concat(bloques, ignore_index=True)
+
+
+# ---------- Formatos columnares y de texto ----------
+FORMATOS_ADMITIDOS = ["xlsx", "csv", "parquet", "jsonl"]
+
+
+def extension_archivo(nombre):
+    extension = os.path.splitext(nombre or "")[1].lower().lstrip(".")
+    return "jsonl" if extension in ("json", "ndjson") else extension
+
+
+def _recortar(df, limite_filas=None, fraccion_muestreo=None, semilla=0):
+    """Aplica a los formatos rápidos el mismo límite de filas y muestreo que la lectura por bloques de Excel."""
+    if fraccion_muestreo is not None and fraccion_muestreo < 1:
+        rng = np.random.default_rng(semilla)
+        df = df[rng.random(len(df)) < fraccion_muestreo]
+    if limite_filas is not None:
+        df = df.head(limite_filas)
+    return df.reset_index(drop=True)
+
+
+def leer_csv(fuente):
+    try:
+        return pd.read_csv(fuente, engine="pyarrow")
+    except ImportError:  # Motor pyarrow no disponible: parser en C de pandas
+        return pd.read_csv(fuente)
+
+
+def leer_jsonl(fuente):
+    try:
+        return pd.read_json(fuente, lines=True, engine="pyarrow")
+    except (ImportError, TypeError, ValueError):
+        # pandas < 2.0 no tiene engine, o pyarrow no está instalado
+        if hasattr(fuente, "seek"):
+            fuente.seek(0)
+        return pd.read_json(fuente, lines=True)
+
+
+def leer_datos(fuente, extension, limite_filas=None, fraccion_muestreo=None, progreso=None):
+    """Parsea `fuente` (ruta o buffer binario) según su formato. Todos devuelven un DataFrame sin tipar."""
+    if extension == "xlsx":
+        return leer_excel_por_bloques(fuente, limite_filas, fraccion_muestreo, progreso=progreso)
+    if extension == "csv":
+        df = leer_csv(fuente)
+    elif extension == "parquet":
+        df = pd.read_parquet(fuente)
+    elif extension == "jsonl":
+        df = leer_jsonl(fuente)
+    else:
+        raise ValueError(f"Formato no admitido: '.{extension}'. Usa uno de: {', '.join(FORMATOS_ADMITIDOS)}")
+    if progreso is not None:
+        progreso(1.0, f"Archivo leído: {len(df):,} filas")
+    return _recortar(df, limite_filas, fraccion_muestreo)
+
+
+# ---------- Lectura de archivos subidos ----------
+class ArchivoLocal:
+    """Archivo de una carpeta local con la misma interfaz que los de `st.file_uploader` (`name`, `getvalue()`)."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.name = os.path.basename(ruta)
+
+    def getvalue(self):
+        with open(self.ruta, "rb") as f:
+            return f.read()
+
+
+def archivos_en_carpeta(carpeta):
+    """Archivos con formato admitido dentro de `carpeta` (sin recorrer subcarpetas), ordenados por nombre."""
+    if not os.path.isdir(carpeta):
+        raise FileNotFoundError(f"No existe la carpeta '{carpeta}'")
+    return [ArchivoLocal(os.path.join(carpeta, nombre)) for nombre in sorted(os.listdir(carpeta))
+            if extension_archivo(nombre) in FORMATOS_ADMITIDOS and not nombre.startswith(("~$", "."))]
+
+
+def _clave_lectura(datos, limite_filas=None, fraccion_muestreo=None):
+    clave = f"{VERSION_CACHE}-{hash_contenido(datos)}"
+    if limite_filas is not None or fraccion_muestreo is not None:
+        clave = f"{clave}-n{limite_filas}-m{fraccion_muestreo}"
+    return clave
+
+
+def buscar_en_caches(clave):
+    """Busca primero en la caché en memoria y luego en la copia Arrow en disco."""
+    df = cache_datasets.obtener(clave)
+    if df is None:
+        df = leer_cache_disco(clave)
+        if df is not None:
+            cache_datasets.guardar(clave, df)
+            df = df.copy(deep=False)
+    return df
+
+
+def _parsear_tipado(datos, extension, limite_filas=None, fraccion_muestreo=None, progreso=None):
+    """Parsea y aplica el esquema. Es una función de módulo para poder ejecutarse en el pool de procesos."""
+    crudo = leer_datos(io.BytesIO(datos), extension, limite_filas, fraccion_muestreo, progreso=progreso)
+    df = esquema.aplicar_esquema(crudo)
+    return df, esquema.reporte_memoria(crudo, df)
+
+
+def registrar(clave, df, reporte=None, en_disco=True):
+    if reporte is not None:
+        reportes_memoria.guardar(clave, reporte)
+    if en_disco:
+        guardar_cache_disco(clave, df)
+    cache_datasets.guardar(clave, df)
+    return df.copy(deep=False)
+
+
+def leer_archivo_cacheado(archivo, limite_filas=None, fraccion_muestreo=None, progreso=None):
+    """Lee el archivo subido reutilizando el DataFrame ya parseado si el contenido no cambió.
+
+    Admite Excel, CSV (motor pyarrow), Parquet y JSON Lines; el formato se deduce del nombre.
+    Primero se busca en la caché en memoria, luego en la copia Arrow en disco y solo
+    si no existe ninguna se parsea el archivo. Lo que se guarda en ambas cachés ya tiene
+    aplicado el esquema tipado de `esquema.ESQUEMA`, sea cual sea el formato de origen.
+
+    `archivo` es el objeto que devuelve `st.file_uploader` (o cualquier objeto con `getvalue()` y `name`).
+    El límite de filas y el muestreo forman parte de la clave, de modo que una lectura parcial
+    nunca se confunde con la completa. Devuelve el DataFrame y la huella del contenido.
+    """
+    extension = extension_archivo(getattr(archivo, "name", "datos.xlsx"))
+    datos = archivo.getvalue()
+    clave = _clave_lectura(datos, limite_filas, fraccion_muestreo)
+    df = buscar_en_caches(clave)
+    if df is None:
+        df, reporte = _parsear_tipado(datos, extension, limite_filas, fraccion_muestreo, progreso=progreso)
+        df = registrar(clave, df, reporte)
+    return df, clave
+
+
+def leer_varios_cacheado(archivos, limite_filas=None, fraccion_muestreo=None, progreso=None, max_procesos=None):
+    """Lee varios archivos (p. ej. una exportación por mes) y los concatena con un esquema común.
+
+    Cada archivo se cachea por separado, así al añadir un mes solo se parsea el nuevo. Los que no
+    están en caché se parsean en paralelo en un pool de procesos, de modo que el total tarda
+    aproximadamente lo que el archivo más grande. Devuelve el DataFrame combinado y su huella.
+    """
+    if len(archivos) == 1:
+        return leer_archivo_cacheado(archivos[0], limite_filas, fraccion_muestreo, progreso=progreso)
+
+    archivos = sorted(archivos, key=lambda archivo: archivo.name)
+    contenidos = [archivo.getvalue() for archivo in archivos]
+    claves = [_clave_lectura(datos, limite_filas, fraccion_muestreo) for datos in contenidos]
+    clave_total = hash_contenido("|".join(claves).encode())
+    df = cache_datasets.obtener(clave_total)
+    if df is not None:
+        return df, clave_total
+
+    frames = [buscar_en_caches(clave) for clave in claves]
+    pendientes = [i for i, frame in enumerate(frames) if frame is None]
+    if pendientes:
+        # spawn y no fork: el servidor de Streamlit tiene hilos vivos que no deben duplicarse
+        contexto = multiprocessing.get_context("spawn")
+        procesos = min(len(pendientes), max_procesos or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+            futuros = {pool.submit(_parsear_tipado, contenidos[i], extension_archivo(archivos[i].name),
+                                   limite_filas, fraccion_muestreo): i for i in pendientes}
+            for terminados, futuro in enumerate(as_completed(futuros), start=1):
+                i = futuros[futuro]
+                frames[i] = registrar(claves[i], *futuro.result())
+                if progreso is not None:
+                    progreso(terminados / len(pendientes),
+                             f"Archivos leídos: {terminados} de {len(pendientes)} ({archivos[i].name})")
+    del contenidos
+
+    df = esquema.concatenar(frames)
+    if limite_filas is not None:
+        df = df.head(limite_filas)
+    reportes = [reportes_memoria.obtener(clave) for clave in claves]
+    if all(reporte is not None for reporte in reportes):
+        reportes_memoria.guardar(clave_total, esquema.sumar_reportes(reportes))
+    # El combinado solo va a memoria: en disco ya están las piezas
+    cache_datasets.guardar(clave_total, df)
+    return df.copy(deep=False), clave_total
+
+
+# ---------- Carga en segundo plano ----------
+MAX_TRABAJOS = 16
+
+
+_huellas_subidas = OrderedDict()   # file_id de la subida -> huella de su contenido
+_lock_huellas = threading.Lock()
+
+
+def huella_fuente(archivo):
+    """Identificador de un archivo para no releerlo en cada rerun mientras se espera la carga.
+
+    Las subidas se identifican por el hash de su contenido y no por `file_id`, que cambia en cada
+    sesión: así el mismo archivo subido desde dos sesiones comparte un solo trabajo. El hash se
+    calcula una vez por `file_id`, no en cada rerun.
+    """
+    if isinstance(archivo, ArchivoLocal):
+        estado = os.stat(archivo.ruta)
+        return (archivo.ruta, estado.st_mtime_ns, estado.st_size)
+    file_id = getattr(archivo, "file_id", None)
+    with _lock_huellas:
+        huella = _huellas_subidas.get(file_id) if file_id is not None else None
+    if huella is None:
+        huella = hash_contenido(archivo.getvalue())
+        if file_id is not None:
+            with _lock_huellas:
+                _huellas_subidas[file_id] = huella
+                while len(_huellas_subidas) > MAX_TRABAJOS * 4:
+                    _huellas_subidas.popitem(last=False)
+    return huella
+
+
+class TrabajoCarga:
+    """Carga que corre en un hilo de fondo; el script de Streamlit solo consulta su estado.
+
+    El hilo nunca llama a `st.*`: el progreso se guarda aquí y la interfaz lo pinta en cada rerun.
+    """
+
+    def __init__(self):
+        self.fraccion = 0.0
+        self.texto = "En cola..."
+        self.futuro = None
+
+    def progreso(self, fraccion, texto):
+        self.fraccion, self.texto = fraccion, texto
+
+    def terminado(self):
+        return self.futuro.done()
+
+    def resultado(self):
+        """Devuelve el resultado; si la carga falló, se olvida el trabajo para poder reintentarla y se relanza el error."""
+        if self.futuro.exception() is not None:
+            with _lock_trabajos:
+                for clave, trabajo in list(_trabajos.items()):
+                    if trabajo is self:
+                        del _trabajos[clave]
+        return self.futuro.result()
+
+
+_ejecutor_cargas = ThreadPoolExecutor(max_workers=2, thread_name_prefix="carga")
+_trabajos = OrderedDict()
+_lock_trabajos = threading.Lock()
+
+
+def en_segundo_plano(clave, funcion):
+    """Lanza `funcion(progreso)` en un hilo de fondo, o devuelve el trabajo ya lanzado con la misma clave.
+
+    Los trabajos se comparten entre sesiones: dos analistas que suben el mismo archivo esperan a la misma carga.
+    """
+    with _lock_trabajos:
+        trabajo = _trabajos.get(clave)
+        if trabajo is not None:
+            _trabajos.move_to_end(clave)
+            return trabajo
+        trabajo = TrabajoCarga()
+        trabajo.futuro = _ejecutor_cargas.submit(funcion, trabajo.progreso)
+        _trabajos[clave] = trabajo
+        # Olvidar los trabajos terminados más antiguos; sus datos siguen en las cachés
+        for clave_vieja in [c for c, t in _trabajos.items() if t.terminado()][:max(0, len(_trabajos) - MAX_TRABAJOS)]:
+            del _trabajos[clave_vieja]
+        return trabajo
+
+
+def asociar_trabajo(clave, otra_clave):
+    """Registra también con `otra_clave` el trabajo lanzado con `clave`."""
+    with _lock_trabajos:
+        trabajo = _trabajos.get(clave)
+        if trabajo is not None:
+            _trabajos[otra_clave] = trabajo
+
+
+# ---------- Dataset preparado para el dashboard ----------
+capacidades_datasets = CacheLRU(LIMITE_CAPACIDADES_BYTES)   # misma clave que el preparado en cache_datasets
+
+
+def preparar_cacheado(df, clave):
+    """`esquema.preparar_dataset` una sola vez por dataset: el resultado y su mapa de capacidades se cachean por huella.
+
+    Si cualquiera de los dos fue expulsado se vuelven a calcular juntos.
+    """
+    clave_preparado = f"{clave}-preparado"
+    preparado = cache_datasets.obtener(clave_preparado)
+    capacidades = capacidades_datasets.obtener(clave_preparado)
+    if preparado is None or capacidades is None:
+        preparado, capacidades = esquema.preparar_dataset(df)
+        capacidades_datasets.guardar(clave_preparado, capacidades)
+        cache_datasets.guardar(clave_preparado, preparado)
+        preparado = preparado.copy(deep=False)
+    return preparado, capacidades
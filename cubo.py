@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+
+import aproximado
+import carga
+import indices
+import nucleos
+
+# ---------- Roll-ups precalculados en la ingesta ----------
+DIMENSIONES = ['city', 'predicted_category', 'Clasificacion', 'product type',
+               'estado_canonico', 'PuntajeEstrellas', 'dia']
+MEDIDAS = ['total', 'suma_estrellas', 'cuenta_estrellas', 'suma_confianza', 'cuenta_confianza']
+# Dimensiones de pocos valores que llevan todos los roll-ups: los filtros de categoría y sentimiento
+# se resuelven en cualquiera de ellos
+BASE = ['predicted_category', 'Clasificacion']
+# Cada roll-up es BASE más lo que necesita una vista. Ciudad y día nunca comparten clave: juntos
+# tienen casi una celda por fila y el roll-up dejaría de resumir nada
+ROLLUPS = {
+    'base': [],
+    'estrellas': ['PuntajeEstrellas'],
+    'producto': ['product type'],
+    'estado': ['estado_canonico'],
+    'ciudad': ['city', 'estado_canonico'],   # el estado depende de la ciudad: casi no añade celdas
+    'dia': ['dia'],
+}
+LIMITE_CUBOS_BYTES = 256 * 1024**2
+LIMITE_OPCIONES_BYTES = 4 * 1024**2
+
+
+def _origenes(df):
+    """Serie de cada dimensión presente en `df`. El día sale de 'fecha': por día y no por semana, así
+    el rango de fechas de la barra lateral también se resuelve en el roll-up."""
+    origenes = {dimension: df[dimension] for dimension in DIMENSIONES if dimension in df.columns}
+    if 'fecha' in df.columns:
+        origenes['dia'] = df['fecha'].dt.normalize()
+    return {dimension: origenes[dimension] for dimension in DIMENSIONES if dimension in origenes}
+
+
+def _medidas(df):
+    """Suma y cuenta por fila de estrellas y confianza, y los promedios que tienen columna de origen."""
+    medidas, promedios = {}, set()
+    for columna, nombre in [('PuntajeEstrellas', 'estrellas'), ('confidence', 'confianza')]:
+        if columna in df.columns:
+            promedios.add(nombre)
+        serie = (pd.to_numeric(df[columna], errors='coerce').astype('float64') if columna in df.columns
+                 else pd.Series(np.nan, index=df.index))
+        medidas[f'suma_{nombre}'] = serie.fillna(0).to_numpy()
+        medidas[f'cuenta_{nombre}'] = serie.notna().to_numpy().astype(np.int64)
+    return medidas, promedios
+
+
+class Cubo:
+    """Roll-ups pequeños de conteos y sumas de estrellas/confianza, uno por grupo de vistas.
+
+    Cada roll-up guarda una celda por combinación presente de sus dimensiones (un código entero por
+    dimensión, -1 = valor faltante) con las medidas sumadas, como columnas numpy {nombre: array}. Una vista se responde desde el roll-up
+    más pequeño que contiene sus dimensiones y las de los filtros activos; si ninguno las contiene
+    (p. ej. ciudad y rango de fechas a la vez) se agregan solo las filas filtradas, que da el índice.
+    """
+
+    def __init__(self, df, indice):
+        self.indice = indice
+        self.n = len(df)
+        self.valores = {}   # dimensión -> Index con el valor de cada código
+        self.codigos = {}   # dimensión -> código de cada fila
+        for dimension, origen in _origenes(df).items():
+            self.codigos[dimension], self.valores[dimension] = indices.codificar(origen)
+        self.dimensiones = list(self.codigos)
+        self.medidas, self.promedios = _medidas(df)   # medida -> valor por fila (sin 'total', que es una por fila)
+
+        base = [d for d in BASE if d in self.valores]
+        claves = {nombre: base + [d for d in extra if d in self.valores]
+                  for nombre, extra in ROLLUPS.items() if not extra or any(d in self.valores for d in extra)}
+        # Los roll-ups contenidos en el de ciudad se reagrupan desde sus celdas, no desde las filas
+        derivados = {'base', 'estado'} & set(claves) if 'ciudad' in claves else set()
+        rollups = {nombre: (clave, self._agregar(clave)) for nombre, clave in claves.items()
+                   if nombre not in derivados}
+        for nombre in derivados:
+            rollups[nombre] = (claves[nombre], self._agregar(claves[nombre], rollups['ciudad'][1]))
+        self._ordenar(rollups)
+
+    def _ordenar(self, rollups):
+        # De menor a mayor: cortar() se queda con el primero que contiene lo que necesita
+        self.rollups = dict(sorted(rollups.items(), key=lambda item: len(item[1][1]['total'])))
+        self._opciones = carga.CacheLRU(LIMITE_OPCIONES_BYTES)   # (dimensión, otros filtros) -> opciones
+
+    def anexar(self, df, indice):
+        """Cubo de `df`, que son las filas de este cubo seguidas de filas nuevas, sin volver a agrupar las anteriores.
+
+        Los códigos existentes no cambian: los valores nuevos de cada dimensión se numeran a
+        continuación. Cada roll-up se reagrupa desde sus celdas más las filas nuevas, así el coste
+        depende del tamaño de los roll-ups y del delta, no del histórico. Si las filas nuevas traen
+        una dimensión o medida que el cubo no tenía, se construye desde cero.
+        """
+        delta = df.iloc[self.n:]
+        origenes = _origenes(delta)
+        medidas, promedios = _medidas(delta)
+        if list(origenes) != self.dimensiones or not promedios <= self.promedios:
+            return Cubo(df, indice)
+        nuevo = Cubo.__new__(Cubo)
+        nuevo.indice, nuevo.n, nuevo.dimensiones, nuevo.promedios = indice, len(df), self.dimensiones, self.promedios
+        nuevo.valores, nuevo.codigos, filas_delta = {}, {}, {}
+        for dimension, origen in origenes.items():
+            codigos, valores = indices.codificar(origen)
+            nuevo.valores[dimension], filas_delta[dimension] = indices.unir_codigos(self.valores[dimension], codigos, valores)
+            nuevo.codigos[dimension] = np.concatenate([self.codigos[dimension], filas_delta[dimension]])
+        nuevo.medidas = {medida: np.concatenate([self.medidas[medida], valores]) for medida, valores in medidas.items()}
+        filas_delta.update(medidas, total=np.ones(len(delta), dtype=np.int64))
+        nuevo._ordenar({nombre: (clave, nuevo._agregar(clave, {columna: np.concatenate([valores, filas_delta[columna]])
+                                                                for columna, valores in celdas.items()}))
+                        for nombre, (clave, celdas) in self.rollups.items()})
+        return nuevo
+
+    def _agregar(self, dimensiones, origen=None):
+        """Celdas con las medidas sumadas por combinación de `dimensiones`, desde las filas o desde `origen`.
+
+        La combinación se codifica en un solo entero (faltante = 0 en cada dimensión) y se agrupa con
+        np.unique + bincount, sin groupby de pandas.
+        """
+        if origen is None:
+            codigos = self.codigos
+            medidas = dict(self.medidas, total=np.ones(self.n, dtype=np.int64))
+            n = self.n
+        else:
+            codigos, medidas, n = origen, origen, len(origen['total'])
+        combinado = np.zeros(n, dtype=np.int64)
+        posibles = 1
+        for dimension in dimensiones:
+            combinado = combinado * (len(self.valores[dimension]) + 1) + codigos[dimension] + 1
+            posibles *= len(self.valores[dimension]) + 1
+        if posibles <= 2 * n:
+            # Pocas combinaciones posibles: se numeran las presentes con un bincount, sin ordenar
+            unicas = np.flatnonzero(np.bincount(combinado, minlength=posibles))
+            numeracion = np.zeros(posibles, dtype=np.intp)
+            numeracion[unicas] = np.arange(len(unicas))
+            grupo = numeracion[combinado]
+        else:
+            unicas, grupo = np.unique(combinado, return_inverse=True)
+        resultado = {}
+        for dimension in reversed(dimensiones):
+            unicas, codigo = np.divmod(unicas, len(self.valores[dimension]) + 1)
+            resultado[dimension] = (codigo - 1).astype(np.int32)
+        columnas = {d: resultado[d] for d in dimensiones}
+        for medida in MEDIDAS:
+            suma = np.bincount(grupo, weights=medidas[medida], minlength=len(unicas))
+            columnas[medida] = suma if medida.startswith('suma') else np.rint(suma).astype(np.int64)
+        return columnas
+
+    def tiene(self, *dimensiones):
+        return all(d in self.valores for d in dimensiones)
+
+    def _codigos_filtro(self, dimension, valor):
+        if dimension == indices.COLUMNA_FECHA:
+            inicio, fin = indices.rango_fechas(valor)
+            return np.flatnonzero((self.valores['dia'] >= inicio) & (self.valores['dia'] < fin))
+        codigos = self.valores[dimension].get_indexer(list(valor))
+        return codigos[codigos >= 0]
+
+    def cortador(self, filtros, limite_muestra=None):
+        """Función `cortar(*dimensiones)` -> celdas que cumplen todos los filtros activos, con al menos
+        esas dimensiones como columnas.
+
+        Cada corte sale del roll-up más pequeño que contiene sus dimensiones y las filtradas (isin
+        sobre códigos). Si no hay ninguno, de las filas que da el índice, cada una como celda de
+        total 1; se buscan una sola vez para todos los cortes de la misma combinación de filtros.
+        Con `limite_muestra` (modo aproximado), si esas filas pasan del límite se usa una muestra
+        estratificada con pesos (aproximado.muestra_ponderada) y `cortar.estimado` queda en True.
+        """
+        activos = indices.filtros_activos(filtros)
+        filtradas = {'dia' if d == indices.COLUMNA_FECHA else d for d in activos}
+        filas = []
+
+        def cortar(*dimensiones):
+            necesarias = filtradas | set(dimensiones)
+            for clave, celdas in self.rollups.values():
+                if necesarias <= set(clave):
+                    if not activos:
+                        return celdas
+                    mascara = np.ones(len(celdas['total']), dtype=bool)
+                    for dimension, valor in activos.items():
+                        columna = 'dia' if dimension == indices.COLUMNA_FECHA else dimension
+                        mascara &= np.isin(celdas[columna], self._codigos_filtro(dimension, valor))
+                    return {columna: valores[mascara] for columna, valores in celdas.items()}
+            if not filas:
+                filas.append(self._filas_corte(activos, limite_muestra))
+                cortar.estimado = filas[0][1] is not None
+            return self._celdas_filas(*filas[0], dimensiones)
+        cortar.estimado = False
+        return cortar
+
+    def cortar(self, filtros, dimensiones=()):
+        return self.cortador(filtros)(*dimensiones)
+
+    def _filas_corte(self, activos, limite_muestra):
+        """Filas filtradas y sus pesos (None si no hubo muestra)."""
+        filas = self.indice.filas(activos)
+        if filas is None:
+            filas = np.arange(self.n)
+        if limite_muestra is None or len(filas) <= limite_muestra:
+            return filas, None
+        estratos = (self.codigos[aproximado.COLUMNA_ESTRATO][filas] if aproximado.COLUMNA_ESTRATO in self.codigos
+                    else np.zeros(len(filas), dtype=np.intp))
+        return aproximado.muestra_ponderada(estratos, filas, limite_muestra)
+
+    def _celdas_filas(self, filas, pesos, dimensiones):
+        columnas = {d: self.codigos[d][filas] for d in dimensiones}
+        columnas['total'] = np.ones(len(filas), dtype=np.int64) if pesos is None else pesos
+        for medida, valores in self.medidas.items():
+            columnas[medida] = valores[filas] if pesos is None else valores[filas] * pesos
+        return columnas
+
+    def agrupar(self, celdas, dimension):
+        """Total y promedios ('estrellas', 'confianza') por valor de `dimension`, solo valores presentes."""
+        codigos, tamano = celdas[dimension], len(self.valores[dimension])
+        # np.rint: con una muestra ponderada los totales son sumas de pesos
+        columnas = {'total': np.rint(nucleos.contar(codigos, tamano, celdas['total'])).astype(np.int64)}
+        for nombre in sorted(self.promedios):
+            columnas[nombre] = nucleos.promedio(codigos, tamano, celdas[f'suma_{nombre}'], celdas[f'cuenta_{nombre}'])
+        tabla = pd.DataFrame(columnas, index=self.valores[dimension].rename(dimension))
+        return tabla[tabla['total'] > 0]
+
+    def cruzar(self, celdas, filas, columnas):
+        """Tabla cruzada de conteos filas x columnas, sin filas ni columnas vacías."""
+        conteos = nucleos.cruzar(celdas[filas], len(self.valores[filas]),
+                                 celdas[columnas], len(self.valores[columnas]), celdas['total'])
+        tabla = pd.DataFrame(np.rint(conteos).astype(np.int64), index=self.valores[filas].rename(filas),
+                             columns=self.valores[columnas].rename(columnas))
+        return tabla.loc[tabla.sum(axis=1) > 0, tabla.sum(axis=0) > 0]
+
+    def opciones(self, dimension, filtros):
+        """Valores de `dimension` que aparecen junto con los demás filtros activos (filtros en cascada).
+
+        Los roll-ups ya son el índice de co-ocurrencias entre dimensiones: basta cortar por los otros
+        filtros y ver qué códigos de `dimension` quedan. Sin otros filtros es la lista completa.
+        """
+        otros = {col: valor for col, valor in filtros.items() if col != dimension}
+        clave = (dimension, indices.clave_filtros(indices.filtros_activos(otros)))
+
+        def calcular():
+            codigos = np.unique(self.cortar(otros, [dimension])[dimension])
+            return sorted(self.valores[dimension][codigos[codigos >= 0]].tolist())
+        return self._opciones.obtener_o_construir(clave, calcular)
+
+    def memoria(self):
+        return (sum(valores.nbytes for _, celdas in self.rollups.values() for valores in celdas.values())
+                + sum(codigos.nbytes for codigos in self.codigos.values())
+                + sum(valores.nbytes for valores in self.medidas.values()))
+
+
+_cubos = carga.CacheLRU(LIMITE_CUBOS_BYTES)
+
+
+def registrar(clave, cubo):
+    """Deja en la caché un cubo ya construido (p. ej. por `Cubo.anexar`) para el dataset `clave`."""
+    _cubos.guardar(clave, cubo)
+    return cubo
+
+
+def obtener(df, clave):
+    """Roll-ups del dataset `clave`, construidos en la ingesta y compartidos por todas las sesiones del proceso."""
+    return _cubos.obtener_o_construir(clave, lambda: Cubo(df, indices.obtener(df, clave)))
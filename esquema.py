@@ -0,0 +1,215 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+import geografia
+
+# ---------- Esquema declarado del dataset de quejas ----------
+# Columnas de baja cardinalidad -> category; numéricas -> el tipo más estrecho que las representa
+ESQUEMA = {
+    'city': 'category',
+    'state_code': 'category',
+    'state_name': 'category',
+    'estado_canonico': 'category',
+    'predicted_category': 'category',
+    'Clasificacion': 'category',
+    'product type': 'category',
+    'PuntajeEstrellas': 'int8',
+    'confidence': 'float32',
+}
+
+
+def _convertir(serie, tipo):
+    if tipo == 'category':
+        return serie.astype('category')
+    numerica = pd.to_numeric(serie, errors='coerce')
+    if tipo.startswith('int'):
+        # Solo se estrecha si todos los valores son enteros y caben en el tipo; si no, redondear o
+        # convertir desbordaría en silencio (4.5 -> 4, 200 -> -56) y se conserva el flotante
+        limites = np.iinfo(tipo)
+        validos = numerica.dropna()
+        if not (validos.eq(validos.round()).all() and validos.between(limites.min, limites.max).all()):
+            return numerica
+        if numerica.isna().any():
+            # Los enteros de numpy no admiten nulos: se usa el entero nullable equivalente (Int8)
+            return numerica.astype(tipo.capitalize())
+    return numerica.astype(tipo)
+
+
+def aplicar_esquema(df, esquema=ESQUEMA):
+    """Convierte una sola vez, al cargar, las columnas declaradas en `esquema` que existan en `df`.
+
+    Las columnas ausentes se ignoran y las demás se dejan intactas.
+    """
+    conversiones = {col: _convertir(df[col], tipo) for col, tipo in esquema.items()
+                    if col in df.columns and str(df[col].dtype) != tipo}
+    if not conversiones:
+        return df
+    return df.assign(**conversiones)
+
+
+def quitar_categorias_sin_uso(df):
+    """Quita de las columnas category las categorías que ya no aparecen en `df` (p. ej. tras filtrar filas).
+
+    Sin esto value_counts, head, idxmax y los groupby con observed=False también listan las
+    categorías sin filas, con conteo 0.
+    """
+    categoricas = df.select_dtypes('category').columns
+    if not len(categoricas):
+        return df
+    return df.assign(**{col: df[col].cat.remove_unused_categories() for col in categoricas})
+
+
+def concatenar(frames, esquema=ESQUEMA):
+    """Concatena DataFrames ya tipados conservando los categóricos.
+
+    pd.concat convierte a object las columnas category cuyas categorías no coinciden, así que
+    antes se unifican las categorías de cada columna. Las columnas que falten en algún archivo
+    se rellenan con nulos y vuelven a pasar por el esquema.
+    """
+    frames = [frame for frame in frames if frame is not None]
+    categoricas = {}
+    for frame in frames:
+        for col in frame.select_dtypes('category').columns:
+            categoricas.setdefault(col, []).append(frame[col].cat.categories)
+    unificadas = {col: pd.Index(pd.concat([cats.to_series() for cats in indices]).unique())
+                  for col, indices in categoricas.items()}
+    frames = [frame.assign(**{col: frame[col].cat.set_categories(cats)
+                              for col, cats in unificadas.items()
+                              if col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype)})
+              for frame in frames]
+    return aplicar_esquema(pd.concat(frames, ignore_index=True), esquema)
+
+
+def sumar_reportes(reportes):
+    """Combina los reportes de memoria de varios archivos en uno solo."""
+    combinado = pd.concat([reporte.drop(index='Total') for reporte in reportes])
+    combinado = combinado.groupby(level=0, sort=False).agg(
+        {'Tipo original': 'first', 'MB antes': 'sum', 'Tipo final': 'first', 'MB después': 'sum'})
+    combinado.loc['Total'] = ['', combinado['MB antes'].sum(), '', combinado['MB después'].sum()]
+    return combinado
+
+
+def reporte_memoria(antes, despues):
+    """Tabla por columna con la memoria (MB) y el tipo antes y después de aplicar el esquema."""
+    mb = 1024 ** 2
+    reporte = pd.DataFrame({
+        'Tipo original': antes.dtypes.astype(str),
+        'MB antes': antes.memory_usage(index=False, deep=True) / mb,
+        'Tipo final': despues.dtypes.astype(str),
+        'MB después': despues.memory_usage(index=False, deep=True) / mb,
+    })
+    reporte.loc['Total'] = ['', reporte['MB antes'].sum(), '', reporte['MB después'].sum()]
+    return reporte
+
+
+# ---------- Resolución de columnas y mapa de capacidades ----------
+# Nombres alternativos con los que llegan las columnas desde otras exportaciones
+ALIAS = {
+    'city': ['ciudad'],
+    'predicted_category': ['category', 'categoria', 'categoría'],
+    'PuntajeEstrellas': ['stars', 'rating', 'puntaje estrellas'],
+    'Clasificacion': ['clasificación', 'sentiment', 'sentimiento clasificado'],
+    'product type': ['product_type', 'producto', 'tipo de producto'],
+    'state_name': ['state', 'estado'],
+    'state_code': ['state code', 'codigo estado'],
+    'zip code': ['zip', 'zipcode', 'zip_code', 'codigo postal', 'código postal'],
+    'Email sent date': ['email date', 'sent date', 'fecha envio', 'fecha de envío'],
+    'message': ['mensaje', 'comment', 'comentario'],
+    'complaint id': ['complaint_id', 'id queja'],
+}
+
+# Columnas que cada sección necesita; 'fecha' es derivada de 'Email sent date' y 'estado_canonico'
+# de state_code, state_name y zip code
+REQUISITOS_SECCIONES = {
+    'pdf_distribucion_categorias': ['predicted_category'],
+    'pdf_resumen_general': ['city', 'predicted_category', 'PuntajeEstrellas'],
+    'pdf_percepcion_categoria': ['predicted_category', 'PuntajeEstrellas'],
+    'pdf_sentimientos': ['Clasificacion'],
+    'pdf_categorias_predichas': ['predicted_category'],
+    'pdf_estados': ['estado_canonico'],
+    'pdf_categorias_ciudad': ['city', 'predicted_category'],
+    'pdf_productos': ['product type'],
+    'pdf_serie_temporal': ['fecha'],
+    'pdf_conclusiones': ['predicted_category', 'PuntajeEstrellas', 'city', 'Clasificacion'],
+    'mapa': ['estado_canonico'],
+    'mapa_ciudades': ['city'],
+    'serie_temporal': ['fecha', 'predicted_category'],
+    'resumen_categoria': ['predicted_category', 'PuntajeEstrellas'],
+    'opiniones_categoria': ['predicted_category', 'PuntajeEstrellas'],
+    'top_ciudades': ['city'],
+    'rating_categoria': ['predicted_category', 'PuntajeEstrellas'],
+    'distribucion_ratings': ['PuntajeEstrellas'],
+    'sentimientos': ['Clasificacion'],
+    'sentimiento_categoria': ['predicted_category', 'Clasificacion'],
+    'nube_palabras': ['tokens'],
+    'comentarios': ['message', 'Clasificacion'],
+}
+
+
+def _normalizar_nombre(nombre):
+    return " ".join(str(nombre).replace("_", " ").split()).lower()
+
+
+class Capacidades:
+    """Qué columnas tiene un dataset (ya con nombres canónicos) y qué secciones se pueden construir con ellas.
+
+    Se calcula una sola vez por dataset; las secciones consultan `puede(...)` antes de hacer cualquier trabajo.
+    """
+
+    def __init__(self, columnas, alias, derivadas):
+        self.columnas = frozenset(columnas)
+        self.alias = alias            # nombre original -> nombre canónico
+        self.derivadas = derivadas    # columna derivada -> columna de origen
+
+    def tiene(self, *columnas):
+        return all(col in self.columnas for col in columnas)
+
+    def faltantes(self, seccion):
+        return [col for col in REQUISITOS_SECCIONES[seccion] if col not in self.columnas]
+
+    def puede(self, seccion):
+        return not self.faltantes(seccion)
+
+    def memoria(self):
+        """Bytes aproximados de los nombres guardados (para la caché compartida)."""
+        nombres = list(self.columnas) + [n for mapa in (self.alias, self.derivadas) for par in mapa.items() for n in par]
+        return sum(sys.getsizeof(nombre) for nombre in nombres) + sum(
+            sys.getsizeof(contenedor) for contenedor in (self.columnas, self.alias, self.derivadas))
+
+
+def resolver_columnas(df):
+    """Renombra a su nombre canónico las columnas que llegan con alias o con otra capitalización/espaciado."""
+    por_normalizado = {_normalizar_nombre(col): col for col in df.columns}
+    renombres = {}
+    for canonica, alias in ALIAS.items():
+        if canonica in df.columns:
+            continue
+        for candidato in [canonica] + alias:
+            original = por_normalizado.get(_normalizar_nombre(candidato))
+            if original is not None and original not in renombres:
+                renombres[original] = canonica
+                break
+    return (df.rename(columns=renombres) if renombres else df), renombres
+
+
+def preparar_dataset(df):
+    """Resuelve alias, añade las columnas derivadas y devuelve (DataFrame, Capacidades).
+
+    Derivadas: 'fecha' (datetime naive en UTC de 'Email sent date', inválidas como NaT) y 'estado_canonico'
+    (código de estado de state_code, state_name o el prefijo de zip code; ver geografia.estado_canonico).
+    """
+    df, alias = resolver_columnas(df)
+    derivadas = {}
+    if 'Email sent date' in df.columns:
+        # Fechas con zona ('...Z', '+02:00') pasan a UTC sin zona: los filtros comparan con fechas naive
+        fecha = pd.to_datetime(df['Email sent date'], errors='coerce', utc=True).dt.tz_convert(None)
+        df = df.assign(fecha=fecha)
+        derivadas['fecha'] = 'Email sent date'
+    origenes_estado = [col for col in ['state_code', 'state_name', 'zip code'] if col in df.columns]
+    if origenes_estado:
+        df = df.assign(estado_canonico=geografia.estado_canonico(df))
+        derivadas['estado_canonico'] = ', '.join(origenes_estado)
+    df = aplicar_esquema(df)  # Las columnas renombradas también deben quedar tipadas
+    return df, Capacidades(df.columns, alias, derivadas)
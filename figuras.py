@@ -0,0 +1,29 @@
+import io
+
+import matplotlib.pyplot as plt
+
+import carga
+
+# ---------- Figuras ya dibujadas, compartidas entre sesiones ----------
+LIMITE_FIGURAS_BYTES = 64 * 1024 * 1024
+
+_figuras = carga.CacheLRU(LIMITE_FIGURAS_BYTES)   # clave -> PNG en bytes (None si no había nada que dibujar)
+
+
+def _png(dibujar):
+    fig = dibujar()
+    if fig is None:
+        return None
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def png_cacheado(clave, dibujar):
+    """PNG de la figura que devuelve `dibujar()`, que solo se llama la primera vez para cada clave.
+
+    La clave debe incluir todo lo que cambia el gráfico (dataset, filtros, modo). Si `dibujar`
+    devuelve None no hay gráfico (se devuelve None) y también se recuerda, para no repetir el cálculo.
+    """
+    return _figuras.obtener_o_construir(clave, lambda: _png(dibujar))
@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import nucleos
+
+# ---------- Geometría de los estados de EE. UU. ----------
+# El GeoJSON viaja con la aplicación (límites cartográficos del Census Bureau, cb_2016 1:500k), así
+# el mapa funciona sin red. Se incluye ya simplificado en varios niveles de detalle, generados sin
+# conexión con simplificar_estados.py: cada petición solo elige el archivo adecuado para su zoom.
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos")
+
+# Niveles de más fino a más grueso: (archivo en datos/, tolerancia en grados, decimales a los que
+# se cuantizan las coordenadas). Las fronteras comunes se simplifican igual en los dos estados.
+NIVELES = (
+    ("us-states-medio.json", 0.01, 3),   # ~370 KB
+    ("us-states.json", 0.03, 2),         # ~120 KB
+)
+
+# TCS_GEOJSON_ESTADOS permite usar otro archivo con el mismo formato para todos los zooms:
+# cada feature con `id` = código de estado y `properties.name`.
+RUTA_ESTADOS = os.environ.get("TCS_GEOJSON_ESTADOS")
+
+# Nomenclátor de códigos postales (datos/zip-ee-uu.csv, del paquete zipcodes 1.2.0, MIT):
+# ciudad, estado y coordenadas de cada código postal. TCS_ZIPS permite usar otro con las mismas columnas.
+RUTA_ZIPS = os.environ.get("TCS_ZIPS", os.path.join(DIRECTORIO_DATOS, "zip-ee-uu.csv"))
+
+_geometrias = {}   # ruta -> GeoJSON leído
+_zips = None
+_ciudades = None
+_tablas_estados = None
+_lock = threading.Lock()
+
+
+def _leer(ruta):
+    """GeoJSON de `ruta`, leído una sola vez por proceso y compartido por las sesiones."""
+    with _lock:
+        if ruta not in _geometrias:
+            with open(ruta, encoding="utf-8") as archivo:
+                _geometrias[ruta] = json.load(archivo)
+        return _geometrias[ruta]
+
+
+def nivel_para_zoom(zoom):
+    """Nivel (archivo, tolerancia, decimales) más grueso cuyo error no llega a medio píxel con ese
+    zoom; si ninguno alcanza, el más fino."""
+    medio_pixel = 360 / (256 * 2 ** zoom) / 2   # grados por píxel en el ecuador, a la mitad
+    adecuados = [nivel for nivel in NIVELES if nivel[1] <= medio_pixel]
+    return adecuados[-1] if adecuados else NIVELES[0]
+
+
+def _ruta_para_zoom(zoom):
+    if RUTA_ESTADOS:
+        return RUTA_ESTADOS
+    nivel = NIVELES[0] if zoom is None else nivel_para_zoom(zoom)
+    return os.path.join(DIRECTORIO_DATOS, nivel[0])
+
+
+def estados(zoom=None):
+    """GeoJSON de los estados para un mapa con ese `zoom` inicial (sin zoom, el nivel más fino).
+
+    Se entrega el nivel precalculado más ligero que no se distingue del original a esa escala.
+    Cada llamada entrega features y properties nuevos (folium escribe el estilo en
+    `properties`), pero las geometrías son las de la caché y no deben modificarse.
+    """
+    geojson = _leer(_ruta_para_zoom(zoom))
+    return {
+        "type": "FeatureCollection",
+        "features": [dict(feature, properties=dict(feature["properties"])) for feature in geojson["features"]],
+    }
+
+
+# ---------- Nomenclátor y normalización de estados ----------
+def _normalizar(serie):
+    return serie.astype("string").str.strip().str.upper()
+
+
+def _por_valor(serie, traducir):
+    """Aplica `traducir` (Series de texto -> Series) solo a los valores distintos de `serie` y lo
+    reparte a las filas por código, así el coste depende de la cardinalidad y no del número de filas."""
+    codigos, valores = pd.factorize(serie)
+    traducidos = pd.array(traducir(pd.Series(np.asarray(valores, dtype=object), dtype="string")), dtype="string")
+    return pd.Series(traducidos.take(codigos, allow_fill=True), index=serie.index)
+
+
+def _cinco_digitos(valores):
+    # 2134, "02134", "02134-1234" o 2134.0 -> "02134"
+    return valores.str.extract(r"^\s*(\d{3,5})")[0].str.zfill(5)
+
+
+def zips():
+    """Nomenclátor completo indexado por código postal (5 dígitos), leído una vez por proceso."""
+    global _zips, _ciudades
+    with _lock:
+        if _zips is None:
+            tabla = pd.read_csv(RUTA_ZIPS, dtype={"zip": str, "city": str, "state": str})
+            _zips = tabla.set_index("zip")
+            # Una ciudad con varios códigos postales queda en la mediana de todos ellos (resiste a los atípicos)
+            _ciudades = (tabla.assign(city=_normalizar(tabla["city"]))
+                         .groupby(["city", "state"])[["lat", "lon"]].median())
+        return _zips
+
+
+def ciudades():
+    """Latitud y longitud mediana por (CIUDAD, estado) del nomenclátor."""
+    zips()
+    return _ciudades
+
+
+def tablas_estados():
+    """Tablas de búsqueda, construidas una vez por proceso a partir de los archivos incluidos.
+
+    Devuelve (NOMBRE o CÓDIGO -> código, prefijo postal de 3 dígitos -> código, código -> nombre).
+    """
+    global _tablas_estados
+    nombres = {feature["id"]: feature["properties"]["name"] for feature in _leer(_ruta_para_zoom(None))["features"]}
+    tabla = zips().reset_index()
+    with _lock:
+        if _tablas_estados is None:
+            codigos = sorted(set(nombres) | set(tabla["state"].dropna()))
+            por_texto = pd.Series(codigos, index=codigos, dtype="string")
+            por_texto = pd.concat([por_texto, pd.Series(list(nombres), index=[n.upper() for n in nombres.values()],
+                                                        dtype="string")])
+            # Un prefijo casi siempre pertenece a un solo estado; si no, gana el que tiene más códigos
+            prefijos = tabla.assign(prefijo=tabla["zip"].str[:3]).groupby(["prefijo", "state"]).size()
+            por_prefijo = (prefijos.sort_values(kind="stable").reset_index()
+                           .drop_duplicates("prefijo", keep="last").set_index("prefijo")["state"].astype("string"))
+            _tablas_estados = (por_texto, por_prefijo, pd.Series(nombres, dtype="string"))
+        return _tablas_estados
+
+
+def estado_canonico(df):
+    """Código de estado canónico de cada fila de `df`, calculado en una sola pasada vectorizada.
+
+    Se toma state_code si es un código o nombre reconocible; si no, state_name; si tampoco, el
+    prefijo de 3 dígitos de 'zip code'. Las filas sin ninguno válido quedan <NA>.
+    """
+    por_texto, por_prefijo, _ = tablas_estados()
+    resultado = pd.Series(pd.NA, index=df.index, dtype="string")
+    for columna in ["state_code", "state_name"]:
+        if columna in df.columns:
+            resultado = resultado.fillna(
+                _por_valor(df[columna], lambda valores: por_texto.reindex(_normalizar(valores)).reset_index(drop=True)))
+    if "zip code" in df.columns:
+        resultado = resultado.fillna(_por_valor(
+            df["zip code"],
+            lambda valores: por_prefijo.reindex(_cinco_digitos(valores).str[:3]).reset_index(drop=True)))
+    return resultado
+
+
+def nombres_estados(codigos):
+    """Nombre de cada código de estado (el propio código si no está en el GeoJSON)."""
+    nombres = tablas_estados()[2]
+    codigos = pd.Series(codigos, dtype="string")
+    return nombres.reindex(codigos).fillna(codigos).to_numpy()
+
+
+# ---------- Coordenadas de ciudades ----------
+def _separar_ciudad(etiquetas):
+    """("Chicago, IL", ...) -> (nombres en mayúsculas, estado o <NA>) sin recorrer fila a fila."""
+    partes = _normalizar(pd.Series(etiquetas, dtype="string")).str.extract(r"^(.*?)(?:\s*,\s*([A-Z]{2}))?$")
+    return partes[0], partes[1]
+
+
+def _mas_frecuente(codigos_ciudad, n_ciudades, codigos_otro, valores_otro):
+    """Para cada ciudad, el valor de otra columna que más se repite en sus filas (o <NA>)."""
+    tabla = nucleos.cruzar(codigos_ciudad, n_ciudades, codigos_otro, len(valores_otro))
+    resultado = pd.Series(np.asarray(valores_otro, dtype=object)[tabla.argmax(axis=1)], dtype="string") \
+        if len(valores_otro) else pd.Series(pd.NA, index=range(n_ciudades), dtype="string")
+    return resultado.where(tabla.sum(axis=1) > 0 if len(valores_otro) else False)
+
+
+def coordenadas_ciudades(df):
+    """Latitud y longitud de cada valor de 'city' de `df` (NaN si no se pudo ubicar).
+
+    Primero se busca "Ciudad, XX" en el nomenclátor (sin ", XX" se usa el estado canónico más
+    frecuente de la ciudad); si no aparece, el código postal más frecuente de sus filas. Todo son
+    uniones sobre los valores distintos, no filas (mapas.coordenadas_ciudades lo guarda por dataset).
+    """
+    codigos, etiquetas = pd.factorize(df["city"])
+    nombres, estados_ciudad = _separar_ciudad(etiquetas)
+    # Ciudades sin ", XX": el estado más frecuente entre sus filas
+    if "estado_canonico" in df.columns:
+        codigos_estado, valores_estado = pd.factorize(df["estado_canonico"])
+        estados_filas = _mas_frecuente(codigos, len(etiquetas), codigos_estado, pd.Series(valores_estado, dtype="string"))
+        estados_ciudad = estados_ciudad.fillna(estados_filas)
+    claves = pd.MultiIndex.from_arrays([nombres, estados_ciudad])
+    coordenadas = ciudades().reindex(claves).reset_index(drop=True)
+
+    # Las que no están en el nomenclátor: coordenadas de su código postal más frecuente
+    sin_resolver = coordenadas["lat"].isna().to_numpy()
+    if sin_resolver.any() and "zip code" in df.columns:
+        codigos_zip, valores_zip = pd.factorize(_por_valor(df["zip code"], _cinco_digitos))
+        zip_ciudad = _mas_frecuente(codigos, len(etiquetas), codigos_zip, pd.Series(valores_zip, dtype="string"))
+        por_zip = zips()[["lat", "lon"]].reindex(zip_ciudad).reset_index(drop=True)
+        coordenadas = coordenadas.fillna(por_zip)
+    coordenadas.index = pd.Index(etiquetas, name="city")
+    return coordenadas
+
@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import carga
+import cubo
+import esquema
+import indices
+
+# ---------- Histórico persistido con carga incremental ----------
+# Cada lote aceptado se guarda como un segmento Arrow en una carpeta propia, que la expulsión de
+# la caché de disco no toca; los metadatos listan los segmentos en orden. Añadir un lote escribe
+# solo su segmento y actualiza en memoria el dataset, el índice y el cubo sin rehacerlos: el
+# histórico completo solo se vuelve a leer al arrancar el proceso.
+COLUMNA_CLAVE = 'complaint id'
+
+_lock = threading.Lock()
+
+
+def _estado_vacio():
+    # Histórico de este proceso: segmentos ya leídos, dataset preparado, capacidades y claves vistas
+    return {'generacion': None, 'segmentos': [], 'version': None, 'df': None, 'capacidades': None,
+            'claves': set()}
+
+
+_estado = _estado_vacio()
+
+
+def directorio():
+    return os.path.join(carga.DIRECTORIO_CACHE, "historico")
+
+
+def _ruta_metadatos():
+    return os.path.join(directorio(), "historico.json")
+
+
+def _metadatos_vacios(generacion=0):
+    return {'version': None, 'segmentos': [], 'aplicados': [], 'filas': 0, 'generacion': generacion}
+
+
+def _leer_metadatos():
+    try:
+        with open(_ruta_metadatos(), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _metadatos_vacios()
+
+
+def _escribir(ruta, escribir):
+    """Escritura atómica con `escribir(ruta temporal)`; si falla no queda nada a medias y el error se propaga."""
+    os.makedirs(directorio(), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        escribir(temporal)
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+def _guardar_metadatos(metadatos):
+    def escribir(temporal):
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(metadatos, f)
+    _escribir(_ruta_metadatos(), escribir)
+
+
+def _guardar_segmento(nombre, df):
+    if carga.pa is None:
+        raise RuntimeError("El histórico necesita pyarrow para guardar sus segmentos en disco")
+    _escribir(os.path.join(directorio(), nombre), lambda temporal: carga.feather.write_feather(df, temporal))
+
+
+def _leer_segmento(nombre):
+    return esquema.aplicar_esquema(carga.feather.read_table(os.path.join(directorio(), nombre)).to_pandas())
+
+
+def normalizar(df):
+    """'zip code' y las columnas de tipos mezclados (2134 junto a "02134-1234") pasan a texto.
+
+    Arrow no sabe escribir una columna con enteros y cadenas a la vez; además así el lote tiene los
+    mismos tipos en memoria que al leerlo del segmento después de reiniciar.
+    """
+    columnas = [col for col in df.columns if col == 'zip code' or df[col].dtype == object]
+    return df.assign(**{col: df[col].astype('string') for col in columnas}) if columnas else df
+
+
+def claves_filas(df):
+    """Clave de deduplicación: `complaint id` cuando existe y, si falta, un hash del contenido de la fila."""
+    hash_fila = pd.util.hash_pandas_object(df, index=False).map('h{:016x}'.format)
+    if COLUMNA_CLAVE not in df.columns:
+        return hash_fila
+    return df[COLUMNA_CLAVE].astype('string').fillna(hash_fila).astype(str)
+
+
+def _anexar(preparadas, capacidades, claves, segmentos, version):
+    """Añade al histórico en memoria filas ya preparadas, extendiendo índice y cubo en vez de rehacerlos."""
+    anterior = _estado['df']
+    if anterior is None:
+        df = preparadas.reset_index(drop=True)
+        indice = indices.IndiceFiltros(df)
+        cubo_datos = cubo.Cubo(df, indice)
+    else:
+        df = esquema.concatenar([anterior, preparadas])
+        indice = indices.obtener(anterior, _estado['version']).anexar(df)
+        cubo_datos = cubo.obtener(anterior, _estado['version']).anexar(df, indice)
+        previas = _estado['capacidades']
+        capacidades = esquema.Capacidades(df.columns, {**previas.alias, **capacidades.alias},
+                                          {**previas.derivadas, **capacidades.derivadas})
+    indices.registrar(version, indice)
+    cubo.registrar(version, cubo_datos)
+    _estado['claves'].update(claves)
+    _estado.update(df=df, capacidades=capacidades, version=version, segmentos=_estado['segmentos'] + segmentos)
+
+
+def _al_dia(metadatos):
+    """Pone el histórico en memoria al día con los metadatos leyendo solo los segmentos que falten:
+    todos al arrancar el proceso, o los que haya añadido otro proceso."""
+    leidos = _estado['segmentos']
+    if metadatos['generacion'] != _estado['generacion'] or metadatos['segmentos'][:len(leidos)] != leidos:
+        _estado.update(_estado_vacio(), generacion=metadatos['generacion'])
+    faltan = metadatos['segmentos'][len(_estado['segmentos']):]
+    if faltan:
+        preparadas, capacidades = esquema.preparar_dataset(esquema.concatenar([_leer_segmento(n) for n in faltan]))
+        _anexar(preparadas, capacidades, claves_filas(preparadas), faltan, metadatos['version'])
+
+
+def cargar():
+    """Devuelve (DataFrame preparado del histórico, versión, capacidades) o (None, None, None) si está vacío."""
+    with _lock:
+        _al_dia(_leer_metadatos())
+        if _estado['df'] is None:
+            return None, None, None
+        return _estado['df'].copy(deep=False), _estado['version'], _estado['capacidades']
+
+
+def estado():
+    """(generación, versión) del histórico: cambia al vaciarlo y con cada lote que añade filas."""
+    metadatos = _leer_metadatos()
+    return metadatos['generacion'], metadatos['version']
+
+
+def en_segundo_plano(clave, funcion):
+    """carga.en_segundo_plano para una carga que se fusiona con el histórico.
+
+    La clave lleva el estado del histórico, así un trabajo terminado solo se reutiliza mientras el
+    histórico no cambie: tras añadir otro lote, volver a elegir un archivo ya fusionado da el total
+    actual. Al terminar, el trabajo queda registrado también con el estado que dejó, para que los
+    reruns siguientes lo encuentren en vez de lanzar otro.
+    """
+    clave_inicial = repr((clave, estado()))
+
+    def ejecutar(progreso):
+        resultado = funcion(progreso)
+        carga.asociar_trabajo(clave_inicial, repr((clave, estado())))
+        return resultado
+    return carga.en_segundo_plano(clave_inicial, ejecutar)
+
+
+def fusionar(delta, hash_delta):
+    """Añade al histórico solo las filas de `delta` que aún no están, deduplicando por `complaint id`.
+
+    Las filas nuevas se escriben como un segmento propio y solo después de escribirlo el lote cuenta
+    como aplicado; si la escritura falla se lanza el error y el histórico queda como estaba.
+    Volver a subir un lote ya fusionado no hace ningún trabajo.
+    Devuelve (DataFrame preparado completo, versión, capacidades, filas nuevas).
+    """
+    with _lock:
+        metadatos = _leer_metadatos()
+        _al_dia(metadatos)
+        if _estado['df'] is not None and hash_delta in metadatos['aplicados']:
+            return _estado['df'].copy(deep=False), _estado['version'], _estado['capacidades'], 0
+
+        delta = normalizar(delta.reset_index(drop=True))
+        preparadas, capacidades = esquema.preparar_dataset(delta)
+        claves = claves_filas(preparadas)
+        vistas = _estado['claves']
+        sin_repetir = ~claves.duplicated().to_numpy() & np.fromiter(
+            (clave not in vistas for clave in claves), dtype=bool, count=len(claves))
+        nuevas = int(sin_repetir.sum())
+
+        segmentos = []
+        version = metadatos['version']
+        if nuevas or _estado['df'] is None:
+            nombre = f"segmento-{len(metadatos['segmentos']):05d}-{carga.hash_contenido(hash_delta.encode())}.arrow"
+            _guardar_segmento(nombre, delta[sin_repetir].reset_index(drop=True))
+            segmentos = [nombre]
+            version = carga.hash_contenido(f"{version}|{hash_delta}".encode())
+        _guardar_metadatos(dict(
+            metadatos,
+            version=version,
+            segmentos=metadatos['segmentos'] + segmentos,
+            aplicados=metadatos['aplicados'] + [hash_delta],
+            filas=metadatos['filas'] + nuevas,
+        ))
+        if segmentos:
+            _anexar(preparadas[sin_repetir], capacidades, claves[sin_repetir], segmentos, version)
+        return _estado['df'].copy(deep=False), _estado['version'], _estado['capacidades'], nuevas
+
+
+def reiniciar():
+    """Vacía el histórico y borra sus segmentos; la generación sube para que nada anterior se reutilice."""
+    with _lock:
+        metadatos = _leer_metadatos()
+        _guardar_metadatos(_metadatos_vacios(metadatos['generacion'] + 1))
+        for nombre in metadatos['segmentos']:
+            try:
+                os.remove(os.path.join(directorio(), nombre))
+            except OSError:
+                pass  # Otro proceso ya lo borró
+        _estado.update(_estado_vacio())
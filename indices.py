@@ -0,0 +1,234 @@
+import numpy as np
+import pandas as pd
+
+import carga
+
+# ---------- Índices de filas por valor de filtro ----------
+# Junto con los roll-ups de cubo.py son el almacén analítico del dashboard: el dataset se indexa
+# una vez por proceso y no por sesión, los filtros se resuelven sobre el índice y los agregados
+# sobre los roll-ups, sin máscaras booleanas por sesión ni una segunda copia de los datos.
+# Los filtros llegan como {columna: tupla de valores elegidos}; una tupla vacía no filtra.
+# La fecha llega como {'fecha': (primer día, último día)} desde el slider de rango.
+COLUMNAS_FILTRO = ['city', 'predicted_category', 'Clasificacion', 'product type']
+COLUMNA_FECHA = 'fecha'
+# Un valor presente en más de 1/32 de las filas se guarda como bitmap (n/8 bytes);
+# los más raros como lista ordenada de filas, que ocupa menos y se intersecta antes
+DENSIDAD_BITMAP = 1 / 32
+LIMITE_INDICES_BYTES = 256 * 1024**2
+# Vistas filtradas ya materializadas: volver a una combinación de filtros no copia filas otra vez
+LIMITE_VISTAS_BYTES = 256 * 1024**2
+
+
+def codificar(serie):
+    """Código entero de cada fila (-1 = faltante) y el valor que corresponde a cada código."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    codigos, valores = pd.factorize(serie)
+    return codigos, valores
+
+
+def unir_codigos(valores, codigos_nuevos, valores_nuevos):
+    """Añade a `valores` los de `valores_nuevos` que falten y traduce `codigos_nuevos` a esa numeración.
+
+    Los códigos ya asignados se conservan: lo construido con ellos para filas anteriores sigue valiendo.
+    """
+    unidos = valores.append(valores_nuevos[~valores_nuevos.isin(valores)])
+    traduccion = unidos.get_indexer(valores_nuevos)
+    return unidos, np.where(codigos_nuevos >= 0, traduccion[codigos_nuevos], -1).astype(np.int32)
+
+
+def _ordenar_fechas(fechas):
+    """Posiciones de las filas con fecha (sin NaT) ordenadas por fecha, y esas fechas ya ordenadas."""
+    fechas = fechas.to_numpy(dtype='datetime64[ns]')
+    validas = np.flatnonzero(~np.isnat(fechas))
+    orden = validas[np.argsort(fechas[validas], kind='stable')].astype(np.int64)
+    return orden, fechas[orden]
+
+
+def filtros_activos(filtros):
+    return {columna: valor for columna, valor in filtros.items() if len(valor)}
+
+
+def rango_fechas(rango):
+    """Límites del rango de días como Timestamps: inicio incluido y fin exclusivo (el día siguiente al último)."""
+    inicio, fin = rango
+    return pd.Timestamp(inicio), pd.Timestamp(fin) + pd.Timedelta(days=1)
+
+
+class IndiceFiltros:
+    """Índice invertido, construido una vez por dataset, de cada valor de las columnas de filtro.
+
+    Cada valor guarda sus filas como bitmap empaquetado (valores frecuentes) o como lista
+    ordenada de posiciones (valores raros). Una combinación de filtros se resuelve intersectando
+    esas estructuras, sin comparar cadenas ni copiar el DataFrame por cada filtro.
+    Si se eligen varios valores de una columna se hace un `isin` sobre sus códigos enteros, y el
+    rango de fechas se resuelve con `searchsorted` sobre el orden de filas por fecha.
+    """
+
+    def __init__(self, df, columnas=COLUMNAS_FILTRO):
+        self.n = len(df)
+        self.bitmaps = {}   # columna -> {valor: bitmap np.uint8 de n/8 bytes}
+        self.listas = {}    # columna -> {valor: posiciones np.int64 ordenadas}
+        self.codigos = {}   # columna -> (códigos por fila, valor de cada código), para filtros de varios valores
+        for columna in columnas:
+            if columna in df.columns:
+                self._indexar(columna, df[columna])
+
+        # Filas ordenadas por fecha (las NaT quedan fuera): un rango son dos búsquedas binarias
+        self.orden_fechas = self.fechas_ordenadas = None
+        if COLUMNA_FECHA in df.columns:
+            self.orden_fechas, self.fechas_ordenadas = _ordenar_fechas(df[COLUMNA_FECHA])
+
+    def _indexar(self, columna, serie):
+        codigos, valores = codificar(serie)
+        self.codigos[columna] = (codigos, valores)
+        # Orden estable: dentro de cada valor las posiciones quedan ordenadas
+        orden = np.argsort(codigos, kind='stable')
+        limites = np.searchsorted(codigos[orden], np.arange(-1, len(valores) + 1))
+        self.bitmaps[columna], self.listas[columna] = {}, {}
+        umbral = self.n * DENSIDAD_BITMAP
+        for codigo, valor in enumerate(valores):
+            filas = orden[limites[codigo + 1]:limites[codigo + 2]].astype(np.int64)
+            if len(filas) > umbral:
+                mascara = np.zeros(self.n, dtype=bool)
+                mascara[filas] = True
+                self.bitmaps[columna][valor] = np.packbits(mascara)
+            else:
+                self.listas[columna][valor] = filas
+
+    def anexar(self, df):
+        """Índice de `df`, que son las filas ya indexadas seguidas de filas nuevas, sin reindexar las anteriores.
+
+        Las posiciones nuevas son mayores que todas las existentes: se añaden al final de las listas,
+        se marcan en los bitmaps (alargados con ceros) y las fechas nuevas se intercalan en el orden
+        con searchsorted. Si cambian las columnas de filtro, se construye desde cero.
+        """
+        columnas = [columna for columna in COLUMNAS_FILTRO if columna in df.columns]
+        if columnas != list(self.codigos) or (COLUMNA_FECHA in df.columns) != (self.orden_fechas is not None):
+            return IndiceFiltros(df)
+        delta = df.iloc[self.n:]
+        nuevo = IndiceFiltros.__new__(IndiceFiltros)
+        nuevo.n = len(df)
+        nuevo.bitmaps, nuevo.listas, nuevo.codigos = {}, {}, {}
+        bytes_bitmap, umbral = -(-nuevo.n // 8), nuevo.n * DENSIDAD_BITMAP
+        for columna in columnas:
+            codigos_anteriores, valores_anteriores = self.codigos[columna]
+            valores, codigos = unir_codigos(valores_anteriores, *codificar(delta[columna]))
+            nuevo.codigos[columna] = (np.concatenate([codigos_anteriores, codigos]), valores)
+            bitmaps = {valor: np.concatenate([bitmap, np.zeros(bytes_bitmap - len(bitmap), dtype=np.uint8)])
+                       for valor, bitmap in self.bitmaps[columna].items()}
+            listas = dict(self.listas[columna])
+            orden = np.argsort(codigos, kind='stable')
+            limites = np.searchsorted(codigos[orden], np.arange(-1, len(valores) + 1))
+            for codigo in np.unique(codigos[codigos >= 0]):
+                valor = valores[codigo]
+                filas = orden[limites[codigo + 1]:limites[codigo + 2]].astype(np.int64) + self.n
+                if valor not in bitmaps:
+                    filas = np.concatenate([listas.pop(valor, np.empty(0, dtype=np.int64)), filas])
+                    if len(filas) <= umbral:
+                        listas[valor] = filas
+                        continue
+                    bitmaps[valor] = np.zeros(bytes_bitmap, dtype=np.uint8)
+                np.bitwise_or.at(bitmaps[valor], filas >> 3, (128 >> (filas & 7)).astype(np.uint8))
+            nuevo.bitmaps[columna], nuevo.listas[columna] = bitmaps, listas
+
+        nuevo.orden_fechas = nuevo.fechas_ordenadas = None
+        if self.orden_fechas is not None:
+            orden, fechas = _ordenar_fechas(delta[COLUMNA_FECHA])
+            # side='right': con la misma fecha las filas anteriores van primero, como en el orden estable
+            posiciones = np.searchsorted(self.fechas_ordenadas, fechas, side='right')
+            nuevo.fechas_ordenadas = np.insert(self.fechas_ordenadas, posiciones, fechas)
+            nuevo.orden_fechas = np.insert(self.orden_fechas, posiciones, orden + self.n)
+        return nuevo
+
+    def extremos_fechas(self):
+        """Primer y último día con datos, o None si el dataset no tiene fechas válidas."""
+        if self.fechas_ordenadas is None or not len(self.fechas_ordenadas):
+            return None
+        return (pd.Timestamp(self.fechas_ordenadas[0]).date(), pd.Timestamp(self.fechas_ordenadas[-1]).date())
+
+    def _filas_rango(self, rango):
+        if self.fechas_ordenadas is None:
+            return np.empty(0, dtype=np.int64)
+        inicio, fin = rango_fechas(rango)
+        desde, hasta = np.searchsorted(self.fechas_ordenadas, [inicio.to_datetime64(), fin.to_datetime64()])
+        return np.sort(self.orden_fechas[desde:hasta])
+
+    def filas(self, filtros):
+        """Posiciones ordenadas de las filas que cumplen todos los filtros activos, o None si no hay ninguno."""
+        bitmaps, listas = [], []
+        for columna, valor in filtros_activos(filtros).items():
+            if columna == COLUMNA_FECHA:
+                listas.append(self._filas_rango(valor))
+            elif columna not in self.codigos:
+                listas.append(np.empty(0, dtype=np.int64))
+            elif len(valor) > 1:
+                codigos, valores = self.codigos[columna]
+                elegidos = valores.get_indexer(list(valor))
+                bitmaps.append(np.packbits(np.isin(codigos, elegidos[elegidos >= 0])))
+            elif valor[0] in self.bitmaps[columna]:
+                bitmaps.append(self.bitmaps[columna][valor[0]])
+            else:
+                listas.append(self.listas[columna].get(valor[0], np.empty(0, dtype=np.int64)))
+        if not bitmaps and not listas:
+            return None
+
+        if listas:
+            # Se parte de la lista más corta y se descartan candidatos contra el resto
+            listas.sort(key=len)
+            candidatas = listas[0]
+            for lista in listas[1:]:
+                candidatas = np.intersect1d(candidatas, lista, assume_unique=True)
+            for bitmap in bitmaps:
+                bits = (bitmap[candidatas >> 3] >> (7 - (candidatas & 7)).astype(np.uint8)) & 1
+                candidatas = candidatas[bits.astype(bool)]
+            return candidatas
+
+        combinado = bitmaps[0] if len(bitmaps) == 1 else np.bitwise_and.reduce(bitmaps)
+        return np.flatnonzero(np.unpackbits(combinado, count=self.n)).astype(np.int64)
+
+    def memoria(self):
+        """Bytes ocupados por el índice."""
+        return (sum(b.nbytes for valores in self.bitmaps.values() for b in valores.values())
+                + sum(l.nbytes for valores in self.listas.values() for l in valores.values())
+                + sum(codigos.nbytes for codigos, _ in self.codigos.values())
+                + (self.orden_fechas.nbytes + self.fechas_ordenadas.nbytes if self.orden_fechas is not None else 0))
+
+
+_indices = carga.CacheLRU(LIMITE_INDICES_BYTES)
+
+
+def registrar(clave, indice):
+    """Deja en la caché un índice ya construido (p. ej. por `IndiceFiltros.anexar`) para el dataset `clave`."""
+    _indices.guardar(clave, indice)
+    return indice
+
+
+def obtener(df, clave):
+    """Índice del dataset `clave`, construido la primera vez y compartido por todas las sesiones del proceso."""
+    return _indices.obtener_o_construir(clave, lambda: IndiceFiltros(df))
+
+
+vistas_filtradas = carga.CacheLRU(LIMITE_VISTAS_BYTES)
+
+
+def clave_filtros(filtros):
+    return tuple(sorted(filtros.items()))
+
+
+def filtrar(df, clave, filtros, columnas=None):
+    """Filas de `df` que cumplen `filtros`, memorizadas por (dataset, filtros) en una LRU compartida por sesiones.
+
+    Con `columnas` solo se copian esas columnas: la selección es una vista (copy-on-write) y `take`
+    copia únicamente las filas elegidas de lo que de verdad se va a mostrar. Sin filtros no hay copia.
+    """
+    seleccion = df if columnas is None else df[list(columnas)]
+    clave_vista = (clave, clave_filtros(filtros), None if columnas is None else tuple(columnas))
+    vista = vistas_filtradas.obtener(clave_vista)
+    if vista is None:
+        filas = obtener(df, clave).filas(filtros)
+        if filas is None:
+            return seleccion
+        vista = seleccion.take(filas)
+        vistas_filtradas.guardar(clave_vista, vista)
+    return vista
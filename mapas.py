@@ -0,0 +1,185 @@
+import hashlib
+import json
+
+import folium
+import numpy as np
+import pandas as pd
+from branca.colormap import LinearColormap
+from branca.element import MacroElement
+from jinja2 import Template
+
+import carga
+import geografia
+import nucleos
+
+# ---------- Mapas coropléticos ya renderizados, compartidos entre sesiones ----------
+LIMITE_MAPAS_BYTES = 64 * 1024 * 1024
+LIMITE_COORDENADAS_BYTES = 32 * 1024 * 1024
+CENTRO_EE_UU = [39.8283, -98.5795]
+# Agrupación de puntos: celdas de TAMANO_CELDA píxeles para cada zoom de ZOOMS_GRUPOS; con más
+# zoom que el último se sigue usando ese nivel
+TAMANO_CELDA = 60
+ZOOMS_GRUPOS = range(3, 11)
+
+_mapas = carga.CacheLRU(LIMITE_MAPAS_BYTES)   # huella -> HTML del mapa
+_coordenadas = carga.CacheLRU(LIMITE_COORDENADAS_BYTES)   # clave del dataset -> coordenadas de cada ciudad
+
+
+def colores(colormap, valores):
+    """Colores "#RRGGBBAA" de `colormap` para todos los `valores` de una vez (igual que colormap(x))."""
+    valores = np.asarray(valores, dtype=np.float64)
+    rgba = np.array(colormap.colors, dtype=np.float64)
+    indice = np.asarray(colormap.index, dtype=np.float64)
+    canales = np.column_stack([np.interp(valores, indice, rgba[:, j]) for j in range(4)])
+    # Los extremos se resuelven como en branca: primero x <= index[0], luego x >= index[-1]. Con un
+    # rango degenerado (vmin == vmax) np.interp devolvería el último color y branca el primero
+    canales[valores >= indice[-1]] = rgba[-1]
+    canales[valores <= indice[0]] = rgba[0]
+    enteros = (canales * 255.9999).astype(int)
+    return ["#%02x%02x%02x%02x" % tuple(fila) for fila in enteros]
+
+
+def huella(conteos, paleta, zoom, titulo):
+    """Huella de todo lo que cambia el HTML: conteos por estado, escala de color, zoom y título."""
+    contenido = json.dumps([sorted((str(k), int(v)) for k, v in conteos.items()), list(paleta), zoom, titulo])
+    return hashlib.blake2b(contenido.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _dibujar(conteos, paleta, zoom, titulo):
+    colormap = LinearColormap(colors=list(paleta),
+                              vmin=min(conteos.values(), default=0),
+                              vmax=max(conteos.values(), default=1))
+    geojson = geografia.estados(zoom=zoom)
+    # Estilo de todos los estados en un solo paso; sin style_function, folium toma properties.style
+    codigos = [feature["id"] for feature in geojson["features"]]
+    rellenos = colores(colormap, pd.Series(conteos, dtype="float64").reindex(codigos, fill_value=0))
+    for feature, relleno in zip(geojson["features"], rellenos):
+        feature["properties"]["style"] = {
+            "fillColor": relleno,
+            "color": "black",
+            "weight": 0.5,
+            "fillOpacity": 0.7,
+        }
+
+    mapa = folium.Map(location=CENTRO_EE_UU, zoom_start=zoom)
+    folium.GeoJson(
+        geojson,
+        tooltip=folium.GeoJsonTooltip(fields=["name"], aliases=["Estado:"], localize=True),
+    ).add_to(mapa)
+    colormap.caption = titulo
+    colormap.add_to(mapa)
+    return folium.Figure().add_child(mapa).render()
+
+
+def coropletico_estados(conteos, paleta, zoom=4, titulo="Cantidad de Registros por Estado"):
+    """HTML del mapa de EE. UU. coloreado según `conteos` ({código de estado: cantidad}).
+
+    Se renderiza una sola vez por huella; los reruns que no cambian los conteos lo reutilizan.
+    Se muestra con st.components.v1.html, igual que hacía folium_static.
+    """
+    clave = huella(conteos, paleta, zoom, titulo)
+    return _mapas.obtener_o_construir(clave, lambda: _dibujar(conteos, paleta, zoom, titulo))
+
+
+# ---------- Puntos por ciudad agrupados en el servidor ----------
+def coordenadas_ciudades(df, clave):
+    """geografia.coordenadas_ciudades del dataset `clave`, calculadas una vez y compartidas por las sesiones."""
+    return _coordenadas.obtener_o_construir(clave, lambda: geografia.coordenadas_ciudades(df))
+
+
+def pixeles(lat, lon, zoom):
+    """Coordenadas en píxeles (Web Mercator, teselas de 256) de cada punto para ese zoom."""
+    escala = 256 * 2 ** zoom
+    lat = np.radians(np.clip(lat, -85.0511, 85.0511))
+    x = (np.asarray(lon) + 180) / 360 * escala
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * escala
+    return x, y
+
+
+def agrupar_en_rejilla(puntos, zoom, tamano_celda=TAMANO_CELDA):
+    """Grupos de `puntos` (columnas lat, lon, total, etiqueta) que caen en la misma celda a ese zoom.
+
+    Cada grupo queda en el centro ponderado por `total` de sus puntos, con la suma de los totales,
+    cuántos puntos reúne y la etiqueta del mayor de ellos.
+    """
+    x, y = pixeles(puntos["lat"].to_numpy(), puntos["lon"].to_numpy(), zoom)
+    celdas = np.floor(x / tamano_celda).astype(np.int64) * (2 ** 32) + np.floor(y / tamano_celda).astype(np.int64)
+    unicas, grupo = np.unique(celdas, return_inverse=True)
+    total = puntos["total"].to_numpy(dtype=np.float64)
+    sumas = nucleos.contar(grupo, len(unicas), total)
+    mayor = pd.Series(total).groupby(grupo).idxmax().to_numpy()
+    return pd.DataFrame({
+        "lat": nucleos.contar(grupo, len(unicas), total * puntos["lat"].to_numpy()) / sumas,
+        "lon": nucleos.contar(grupo, len(unicas), total * puntos["lon"].to_numpy()) / sumas,
+        "total": sumas.astype(np.int64),
+        "puntos": nucleos.contar(grupo, len(unicas)).astype(np.int64),
+        "etiqueta": puntos["etiqueta"].to_numpy()[mayor],
+    })
+
+
+class _GruposPorZoom(MacroElement):
+    """Dibuja en el navegador solo los grupos precalculados para el zoom actual del mapa."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var mapa = {{ this._parent.get_name() }};
+            var niveles = {{ this.niveles|tojson }};
+            var zooms = Object.keys(niveles).map(Number).sort(function(a, b) { return a - b; });
+            var capa = L.layerGroup().addTo(mapa);
+            function dibujar() {
+                var elegido = zooms[0];
+                zooms.forEach(function(z) { if (z <= mapa.getZoom()) { elegido = z; } });
+                capa.clearLayers();
+                niveles[elegido].forEach(function(g) {
+                    L.circleMarker([g[0], g[1]], {
+                        radius: 4 + 16 * Math.sqrt(g[2] / {{ this.maximo }}),
+                        color: {{ this.color|tojson }}, fillColor: {{ this.color|tojson }},
+                        weight: 1, fillOpacity: 0.6
+                    }).bindTooltip(g[3]).addTo(capa);
+                });
+            }
+            mapa.on('zoomend', dibujar);
+            dibujar();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, niveles, maximo, color):
+        super().__init__()
+        self._name = "GruposPorZoom"
+        self.niveles = niveles
+        self.maximo = maximo
+        self.color = color
+
+
+def _dibujar_puntos(puntos, color, zoom):
+    niveles = {}
+    for z in ZOOMS_GRUPOS:
+        grupos = agrupar_en_rejilla(puntos, z)
+        etiquetas = np.where(grupos["puntos"] > 1,
+                             grupos["etiqueta"] + " y " + (grupos["puntos"] - 1).astype(str) + " más",
+                             grupos["etiqueta"]) + ": " + grupos["total"].astype(str) \
+            + np.where(grupos["total"] == 1, " queja", " quejas")
+        niveles[z] = [[round(lat, 4), round(lon, 4), int(total), etiqueta] for lat, lon, total, etiqueta
+                      in zip(grupos["lat"], grupos["lon"], grupos["total"], etiquetas)]
+    mapa = folium.Map(location=CENTRO_EE_UU, zoom_start=zoom)
+    _GruposPorZoom(niveles, max(int(puntos["total"].max()), 1), color).add_to(mapa)
+    return folium.Figure().add_child(mapa).render()
+
+
+def puntos_ciudades(conteos, coordenadas, color, zoom=4):
+    """HTML del mapa con las quejas por ciudad agrupadas por cercanía para cada nivel de zoom.
+
+    `conteos` es {ciudad: cantidad} y `coordenadas` un DataFrame lat/lon indexado por ciudad; las
+    ciudades sin coordenadas no se dibujan. El navegador recibe unos pocos grupos por zoom, no un
+    marcador por fila. Devuelve None si ninguna ciudad se pudo ubicar.
+    """
+    puntos = coordenadas.reindex(list(conteos)).assign(total=list(conteos.values())).dropna()
+    puntos = puntos[puntos["total"] > 0].rename_axis("etiqueta").reset_index()
+    if puntos.empty:
+        return None
+    ubicacion = pd.util.hash_pandas_object(puntos[["lat", "lon"]], index=False).to_numpy()
+    clave = ("ciudades", huella(conteos, [color], zoom, ""),
+             hashlib.blake2b(ubicacion.tobytes(), digest_size=16).hexdigest())
+    return _mapas.obtener_o_construir(clave, lambda: _dibujar_puntos(puntos, color, zoom))
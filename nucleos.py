@@ -0,0 +1,42 @@
+import numpy as np
+
+# ---------- Núcleos de agregación sobre códigos enteros ----------
+# Trabajan con códigos de categoría (0..tamano-1, -1 = faltante) en vez de valores, así un conteo,
+# una suma o una tabla cruzada es un solo np.bincount sin pasar por groupby de pandas.
+
+
+def contar(codigos, tamano, pesos=None):
+    """Conteo (o suma de `pesos`) por código, de longitud `tamano`; los códigos -1 no cuentan."""
+    # Desplazar en uno manda los faltantes a la casilla 0, que se descarta: más barato que filtrarlos
+    desplazados = codigos.astype(np.intp) + 1
+    return np.bincount(desplazados, weights=pesos, minlength=tamano + 1)[1:]
+
+
+def promedio(codigos, tamano, valores, cuentas=None):
+    """Media por código: suma de `valores` entre suma de `cuentas` (una por fila si no se indican).
+
+    Sin `cuentas` los NaN de `valores` se ignoran, igual que groupby().mean(). Los códigos sin
+    datos quedan como NaN.
+    """
+    if cuentas is None:
+        presentes = ~np.isnan(valores)
+        codigos = np.where(presentes, codigos, -1)
+        valores = np.where(presentes, valores, 0.0)
+        n = contar(codigos, tamano)
+    else:
+        n = contar(codigos, tamano, cuentas.astype(np.float64))
+    sumas = contar(codigos, tamano, valores)
+    return np.divide(sumas, n, out=np.full(tamano, np.nan), where=n > 0)
+
+
+def combinar(codigos_filas, tamano_columnas, codigos_columnas):
+    """Código combinado fila * tamano_columnas + columna; -1 si falta alguno de los dos."""
+    combinado = codigos_filas.astype(np.int64) * tamano_columnas + codigos_columnas
+    combinado[(codigos_filas < 0) | (codigos_columnas < 0)] = -1
+    return combinado
+
+
+def cruzar(codigos_filas, tamano_filas, codigos_columnas, tamano_columnas, pesos=None):
+    """Tabla cruzada (tamano_filas x tamano_columnas) con un único bincount sobre el código combinado."""
+    combinado = combinar(codigos_filas, tamano_columnas, codigos_columnas)
+    return contar(combinado, tamano_filas * tamano_columnas, pesos).reshape(tamano_filas, tamano_columnas)
@@ -0,0 +1,130 @@
+"""Genera los niveles de detalle de datos/ (geografia.NIVELES) a partir de un GeoJSON de estados.
+
+El dashboard solo lee los archivos ya simplificados; esto se ejecuta sin conexión cuando cambia la
+geometría de origen (p. ej. cb_2016_us_state_500k convertido a GeoJSON, cada feature con `id` =
+código de estado y `properties.name`).
+
+Uso: python simplificar_estados.py origen.json
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+import geografia
+
+
+# ---------- Simplificación con fronteras comunes ----------
+def _poligonos(geometria):
+    if geometria["type"] == "Polygon":
+        return [geometria["coordinates"]]
+    return geometria["coordinates"]
+
+
+def _douglas_peucker(puntos, tolerancia):
+    """Posiciones que conserva Douglas-Peucker en una polilínea (siempre incluye los extremos)."""
+    conservar = np.zeros(len(puntos), dtype=bool)
+    conservar[[0, -1]] = True
+    pendientes = [(0, len(puntos) - 1)]
+    while pendientes:
+        i, j = pendientes.pop()
+        if j <= i + 1:
+            continue
+        inicio, direccion = puntos[i], puntos[j] - puntos[i]
+        largo = np.hypot(*direccion)
+        tramo = puntos[i + 1:j] - inicio
+        if largo == 0:
+            distancias = np.hypot(tramo[:, 0], tramo[:, 1])
+        else:
+            distancias = np.abs(direccion[0] * tramo[:, 1] - direccion[1] * tramo[:, 0]) / largo
+        k = int(np.argmax(distancias))
+        if distancias[k] > tolerancia:
+            k += i + 1
+            conservar[k] = True
+            pendientes += [(i, k), (k, j)]
+    return np.flatnonzero(conservar)
+
+
+def simplificar_anillos(anillos, tolerancia, decimales):
+    """Simplifica anillos cerrados sin abrir huecos ni solapes entre vecinos.
+
+    Un vértice queda fijo donde cambia el conjunto de anillos que lo comparten; cada tramo entre
+    dos vértices fijos se simplifica siempre en el mismo sentido, así una frontera común sale
+    idéntica en los dos estados. Devuelve None en los anillos que se quedan sin superficie.
+    """
+    abiertos = [np.asarray(anillo, dtype=np.float64)[:-1] for anillo in anillos]
+    duenos = {}
+    for posicion, anillo in enumerate(abiertos):
+        for punto in map(tuple, anillo):
+            duenos.setdefault(punto, set()).add(posicion)
+    salida = []
+    for anillo in abiertos:
+        n = len(anillo)
+        claves = [frozenset(duenos[punto]) for punto in map(tuple, anillo)]
+        fijos = [i for i in range(n) if claves[i] != claves[i - 1] or claves[i] != claves[(i + 1) % n]]
+        if not fijos:   # anillo sin vecinos: se corta en el vértice inicial y el más lejano
+            fijos = sorted({0, int(np.argmax(np.hypot(*(anillo - anillo[0]).T)))})
+        elif len(fijos) == 1:
+            fijos = sorted({fijos[0], (fijos[0] + n // 2) % n})
+        conservados = []
+        for f, inicio in enumerate(fijos):
+            fin = fijos[(f + 1) % len(fijos)]
+            posiciones = np.arange(inicio, fin + (n if fin <= inicio else 0) + 1) % n
+            tramo = anillo[posiciones]
+            invertir = tuple(tramo[0]) > tuple(tramo[-1])
+            elegidos = _douglas_peucker(tramo[::-1] if invertir else tramo, tolerancia)
+            if invertir:
+                elegidos = (len(tramo) - 1 - elegidos)[::-1]
+            conservados.extend(posiciones[elegidos[:-1]])
+        puntos = np.round(anillo[conservados], decimales)
+        # Al cuantizar pueden quedar vértices repetidos seguidos
+        distintos = np.ones(len(puntos), dtype=bool)
+        distintos[1:] = np.any(puntos[1:] != puntos[:-1], axis=1)
+        puntos = puntos[distintos]
+        if len(puntos) > 1 and (puntos[0] == puntos[-1]).all():
+            puntos = puntos[:-1]
+        salida.append(np.vstack([puntos, puntos[:1]]) if len(puntos) >= 3 else None)
+    return salida
+
+
+def simplificar(base, tolerancia, decimales):
+    """GeoJSON con todas las geometrías de `base` simplificadas a la vez (las fronteras son comunes)."""
+    anillos, ubicacion = [], []
+    for f, feature in enumerate(base["features"]):
+        for p, poligono in enumerate(_poligonos(feature["geometry"])):
+            for anillo in poligono:
+                anillos.append(anillo)
+                ubicacion.append((f, p))
+    simplificados = simplificar_anillos(anillos, tolerancia, decimales)
+
+    poligonos = [{} for _ in base["features"]]   # por feature: polígono -> anillos que sobreviven
+    for (f, p), anillo in zip(ubicacion, simplificados):
+        poligonos[f].setdefault(p, []).append(None if anillo is None else anillo.tolist())
+    features = []
+    for feature, por_poligono in zip(base["features"], poligonos):
+        # Un polígono sin exterior desaparece entero; de los huecos solo quedan los que tienen superficie
+        coordenadas = [[anillo for anillo in anillos if anillo is not None]
+                       for anillos in por_poligono.values() if anillos[0] is not None]
+        if not coordenadas:   # un estado nunca se queda sin geometría
+            geometria = feature["geometry"]
+        elif len(coordenadas) == 1:
+            geometria = {"type": "Polygon", "coordinates": coordenadas[0]}
+        else:
+            geometria = {"type": "MultiPolygon", "coordinates": coordenadas}
+        features.append(dict(feature, geometry=geometria))
+    return {"type": "FeatureCollection", "features": features}
+
+
+def main(origen):
+    with open(origen, encoding="utf-8") as archivo:
+        base = json.load(archivo)
+    for nombre, tolerancia, decimales in geografia.NIVELES:
+        ruta = os.path.join(geografia.DIRECTORIO_DATOS, nombre)
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            json.dump(simplificar(base, tolerancia, decimales), archivo, separators=(",", ":"), ensure_ascii=False)
+        print(f"{nombre}: tolerancia {tolerancia}°, {decimales} decimales, {os.path.getsize(ruta) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,229 @@
+import io
+import os
+import time
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import carga
+import esquema
+
+
+def frame(filas):
+    return pd.DataFrame({'x': range(filas)})
+
+
+def test_cache_lru_expulsa_la_menos_usada_por_bytes():
+    tamano = carga.tamano_objeto(frame(1000))
+    cache = carga.CacheLRU(limite_bytes=int(tamano * 2.5))
+    cache.guardar('a', frame(1000))
+    cache.guardar('b', frame(1000))
+    cache.obtener('a')                      # 'a' pasa a ser la más reciente
+    cache.guardar('c', frame(1000))
+    assert cache.obtener('b') is None
+    assert cache.obtener('a') is not None and cache.obtener('c') is not None
+    assert cache.estadisticas()['bytes'] <= cache.limite_bytes
+    # Lo que no cabe ni vaciando la caché no se guarda ni expulsa nada
+    cache.guardar('grande', frame(10_000))
+    assert cache.obtener('grande') is None and cache.estadisticas()['entradas'] == 2
+
+
+def test_cache_lru_entrega_copias_superficiales():
+    cache = carga.CacheLRU()
+    cache.guardar('a', frame(3))
+    entregado = cache.obtener('a')
+    entregado['y'] = 1
+    entregado.loc[0, 'x'] = 99
+    assert cache.obtener('a').columns.tolist() == ['x']
+    assert cache.obtener('a')['x'].tolist() == [0, 1, 2]
+
+
+def test_cache_lru_guarda_none_sin_reconstruir():
+    cache = carga.CacheLRU()
+    llamadas = []
+
+    def construir():
+        llamadas.append(1)
+        return None
+    assert cache.obtener_o_construir('vacia', construir) is None
+    assert cache.obtener_o_construir('vacia', construir) is None
+    assert len(llamadas) == 1
+    assert cache.obtener('vacia', 'sin valor') is None
+    assert cache.obtener('otra', 'sin valor') == 'sin valor'
+
+
+@pytest.fixture
+def caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(carga, 'DIRECTORIO_CACHE', str(tmp_path / 'cache'))
+    monkeypatch.setattr(carga, 'cache_datasets', carga.CacheLRU())
+    monkeypatch.setattr(carga, 'reportes_memoria', carga.CacheLRU(carga.LIMITE_REPORTES_BYTES))
+    return tmp_path
+
+
+def quejas(ciudades):
+    return pd.DataFrame({'complaint id': [f'{c[:3]}-{i}' for i, c in enumerate(ciudades)],
+                         'city': ciudades, 'PuntajeEstrellas': [4.0] * len(ciudades)})
+
+
+def test_carpeta_en_pool_de_procesos(caches):
+    carpeta = caches / 'exportaciones'
+    carpeta.mkdir()
+    quejas(['Chicago, IL', 'Austin, TX']).to_csv(carpeta / 'enero.csv', index=False)
+    quejas(['Miami, FL']).to_csv(carpeta / 'febrero.csv', index=False)
+    (carpeta / 'notas.txt').write_text('no es un dataset')
+    (carpeta / '~$enero.xlsx').write_bytes(b'')
+
+    archivos = carga.archivos_en_carpeta(str(carpeta))
+    assert [archivo.name for archivo in archivos] == ['enero.csv', 'febrero.csv']
+    df, clave = carga.leer_varios_cacheado(archivos, max_procesos=2)
+    assert df['city'].tolist() == ['Chicago, IL', 'Austin, TX', 'Miami, FL']
+    assert isinstance(df['city'].dtype, pd.CategoricalDtype)
+    # Las piezas quedan en disco y el reporte combinado suma los de cada archivo
+    assert len(list((caches / 'cache').glob('*.arrow'))) == 2
+    assert carga.reportes_memoria.obtener(clave).loc['Total', 'MB antes'] > 0
+    assert carga.leer_varios_cacheado(archivos)[1] == clave
+
+
+def test_reportes_de_memoria_acotados(caches, monkeypatch):
+    crudo = quejas(['Chicago, IL'])
+    reporte = esquema.reporte_memoria(crudo, esquema.aplicar_esquema(crudo))
+    monkeypatch.setattr(carga, 'reportes_memoria', carga.CacheLRU(limite_bytes=carga.tamano_objeto(reporte) * 3))
+    for i in range(10):
+        carga.registrar(f'clave-{i}', crudo, reporte, en_disco=False)
+    assert carga.reportes_memoria.estadisticas()['entradas'] == 3
+    assert carga.reportes_memoria.obtener('clave-9') is not None
+    assert carga.reportes_memoria.obtener('clave-0') is None
+
+
+def test_preparado_y_capacidades_se_recalculan_juntos(caches, monkeypatch):
+    monkeypatch.setattr(carga, 'capacidades_datasets', carga.CacheLRU(carga.LIMITE_CAPACIDADES_BYTES))
+    df = esquema.aplicar_esquema(quejas(['Chicago, IL', 'Austin, TX']).rename(columns={'city': 'ciudad'}))
+    preparado, capacidades = carga.preparar_cacheado(df, 'huella')
+    assert carga.preparar_cacheado(df, 'huella')[1] is capacidades
+    # Expulsar las capacidades (o el preparado) vuelve a preparar el dataset en vez de fallar
+    monkeypatch.setattr(carga, 'capacidades_datasets', carga.CacheLRU(carga.LIMITE_CAPACIDADES_BYTES))
+    otra_vez, recalculadas = carga.preparar_cacheado(df, 'huella')
+    assert recalculadas is not capacidades and recalculadas.alias == {'ciudad': 'city'}
+    assert otra_vez['city'].tolist() == preparado['city'].tolist()
+
+
+class Subida:
+    """Lo mismo que devuelve st.file_uploader: nombre y contenido en bytes."""
+
+    def __init__(self, name, datos):
+        self.name = name
+        self.datos = datos
+
+    def getvalue(self):
+        return self.datos
+
+
+def csv_subido(ciudades, nombre='quejas.csv'):
+    return Subida(nombre, quejas(ciudades).to_csv(index=False).encode())
+
+
+def sin_parsear(*args, **kwargs):
+    raise AssertionError("se volvió a parsear un archivo que ya estaba en caché")
+
+
+def test_cache_arrow_recarga_tipada_sin_parsear(caches, monkeypatch):
+    archivo = csv_subido(['Chicago, IL', 'Austin, TX', 'Chicago, IL'])
+    df, clave = carga.leer_archivo_cacheado(archivo)
+    ruta = carga.ruta_cache_disco(clave)
+    # Un solo lote: al recargar, las columnas se mapean sin juntar trozos
+    with carga.pa.memory_map(ruta, 'r') as fuente:
+        assert carga.ipc.open_file(fuente).num_record_batches == 1
+
+    # Proceso nuevo: la caché en memoria está vacía y se recarga de disco con el mismo esquema
+    monkeypatch.setattr(carga, 'cache_datasets', carga.CacheLRU())
+    monkeypatch.setattr(carga, '_parsear_tipado', sin_parsear)
+    recargado, clave_recargada = carga.leer_archivo_cacheado(archivo)
+    assert clave_recargada == clave
+    pd.testing.assert_frame_equal(recargado, df)
+    assert isinstance(recargado['city'].dtype, pd.CategoricalDtype)
+
+
+def test_cache_arrow_se_invalida_con_el_esquema(caches, monkeypatch):
+    archivo = csv_subido(['Chicago, IL'])
+    _, clave = carga.leer_archivo_cacheado(archivo)
+    # Otro esquema u otro formato de caché cambian VERSION_CACHE: la copia anterior no se reutiliza
+    monkeypatch.setattr(carga, 'VERSION_CACHE', 'v-otra')
+    monkeypatch.setattr(carga, 'cache_datasets', carga.CacheLRU())
+    _, clave_nueva = carga.leer_archivo_cacheado(archivo)
+    assert clave_nueva != clave and clave_nueva.startswith('v-otra-')
+    # Una copia corrupta tampoco se usa: se vuelve a parsear
+    with open(carga.ruta_cache_disco(clave_nueva), 'wb') as f:
+        f.write(b'no es arrow')
+    assert carga.leer_cache_disco(clave_nueva) is None
+
+
+def test_limpiar_cache_disco_por_antiguedad_y_tamano(caches):
+    directorio = caches / 'cache'
+    directorio.mkdir()
+    ahora = time.time()
+    for nombre, dias, tamano in [('vieja.arrow', 40, 10), ('media.arrow', 2, 600), ('nueva.arrow', 1, 600),
+                                 ('otra.txt', 40, 10)]:
+        ruta = directorio / nombre
+        ruta.write_bytes(b'x' * tamano)
+        os.utime(ruta, (ahora - dias * 24 * 3600,) * 2)
+    (directorio / 'historico').mkdir()
+    carga.limpiar_cache_disco(limite_bytes=1000, max_dias=30)
+    # Se va la de más de 30 días y, para no pasar de 1000 bytes, la menos usada; el resto no se toca
+    assert sorted(p.name for p in directorio.iterdir()) == ['historico', 'nueva.arrow', 'otra.txt']
+
+
+def libro_excel(ruta, filas):
+    libro = Workbook()
+    hoja = libro.active
+    hoja.append(['city', 'PuntajeEstrellas', None, 'city', 'Email sent date'])   # sin nombre y repetida
+    for fila in filas:
+        hoja.append(fila)
+    libro.save(ruta)
+    return ruta
+
+
+def test_lectura_por_bloques_igual_que_read_excel(tmp_path, monkeypatch):
+    monkeypatch.setattr(carga, 'FILAS_POR_BLOQUE', 4)
+    filas = [[f'Ciudad {i % 3}', i % 5 + 1, None if i % 4 else 'nota', f'Otra {i}', f'2025-03-{i % 28 + 1:02d}']
+             for i in range(11)]
+    ruta = libro_excel(tmp_path / 'quejas.xlsx', filas)
+    avances = []
+    df = carga.leer_excel_por_bloques(str(ruta), progreso=lambda fraccion, texto: avances.append(fraccion))
+    pd.testing.assert_frame_equal(df, pd.read_excel(ruta))
+    assert df.columns.tolist() == ['city', 'PuntajeEstrellas', 'Unnamed: 2', 'city.1', 'Email sent date']
+    assert avances == sorted(avances) and avances[-1] == 1.0 and len(avances) == 3
+
+    assert carga.leer_excel_por_bloques(str(ruta), limite_filas=5)['city.1'].tolist() == [f'Otra {i}' for i in range(5)]
+    muestra = carga.leer_excel_por_bloques(str(ruta), fraccion_muestreo=0.5)
+    assert 0 < len(muestra) < 11 and muestra.equals(carga.leer_excel_por_bloques(str(ruta), fraccion_muestreo=0.5))
+
+
+def test_lectura_por_bloques_salta_filas_vacias(tmp_path):
+    ruta = libro_excel(tmp_path / 'huecos.xlsx', [['Chicago, IL', 5, None, 'x', '2025-03-01'],
+                                                  [None] * 5,
+                                                  ['Austin, TX', 3, None, 'y', '2025-03-02']])
+    assert carga.leer_excel_por_bloques(str(ruta))['city'].tolist() == ['Chicago, IL', 'Austin, TX']
+    assert carga.leer_excel_por_bloques(str(libro_excel(tmp_path / 'vacio.xlsx', []))).empty
+
+
+@pytest.mark.parametrize('nombre', ['quejas.csv', 'quejas.parquet', 'quejas.jsonl', 'quejas.ndjson'])
+def test_formatos_dan_el_mismo_dataset_tipado(caches, nombre):
+    origen = quejas(['Chicago, IL', 'Austin, TX', 'Chicago, IL'])
+    buffer = io.BytesIO()
+    if nombre.endswith('.csv'):
+        origen.to_csv(buffer, index=False)
+    elif nombre.endswith('.parquet'):
+        origen.to_parquet(buffer, index=False)
+    else:
+        origen.to_json(buffer, orient='records', lines=True)
+    df, _ = carga.leer_archivo_cacheado(Subida(nombre, buffer.getvalue()), limite_filas=2)
+    assert df['city'].tolist() == ['Chicago, IL', 'Austin, TX']
+    assert df['complaint id'].tolist() == origen['complaint id'].tolist()[:2]
+    assert isinstance(df['city'].dtype, pd.CategoricalDtype)
+    assert df['PuntajeEstrellas'].dtype == 'int8'
+
+
+def test_formato_no_admitido():
+    with pytest.raises(ValueError, match='Formato no admitido'):
+        carga.leer_datos(io.BytesIO(b'x'), carga.extension_archivo('quejas.txt'))
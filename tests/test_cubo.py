@@ -0,0 +1,141 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import agregados
+import aproximado
+import cubo
+import esquema
+import indices
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    rng = np.random.default_rng(0)
+    n = 3000
+    ciudades = np.array(['Chicago, IL', 'Austin, TX', 'Miami, FL', 'Denver, CO', 'Boston, MA'])
+    ciudad = ciudades[rng.integers(0, len(ciudades), n)]
+    estrellas = rng.integers(1, 6, n).astype('float64')
+    estrellas[rng.random(n) < 0.05] = np.nan
+    df = pd.DataFrame({
+        'city': ciudad,
+        'state_code': [c[-2:] for c in ciudad],
+        'predicted_category': np.array(['A', 'B', 'C'])[rng.integers(0, 3, n)],
+        'Clasificacion': np.array(['Positivo', 'Neutro', 'Negativo'])[rng.integers(0, 3, n)],
+        'product type': np.array(['P1', 'P2', 'P3', 'P4'])[rng.integers(0, 4, n)],
+        'PuntajeEstrellas': estrellas,
+        'Email sent date': (pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 90, n), unit='D')).astype(str),
+    })
+    df, _ = esquema.preparar_dataset(esquema.aplicar_esquema(df))
+    return df, cubo.Cubo(df, indices.IndiceFiltros(df))
+
+
+FILTROS = [
+    {},
+    {'predicted_category': ('A',)},
+    {'city': ('Chicago, IL', 'Miami, FL')},
+    {'fecha': (datetime.date(2025, 1, 10), datetime.date(2025, 2, 15))},
+    {'city': ('Austin, TX',), 'fecha': (datetime.date(2025, 2, 1), datetime.date(2025, 3, 1))},
+    {'product type': ('P2', 'P3'), 'Clasificacion': ('Negativo',)},
+]
+
+
+@pytest.mark.parametrize('filtros', FILTROS)
+def test_agregados_igual_que_pandas(dataset, filtros):
+    df, cubo_datos = dataset
+    filas = indices.IndiceFiltros(df).filas(filtros)
+    vista = df if filas is None else df.take(filas)
+    resultado = agregados.Agregados(cubo_datos, filtros)
+
+    assert resultado.total == len(vista)
+    assert resultado.rating_promedio == pytest.approx(vista['PuntajeEstrellas'].mean())
+    por_ciudad = vista.groupby('city', observed=True)['PuntajeEstrellas'].agg(['size', 'mean'])
+    assert resultado.por_ciudad['total'].to_dict() == por_ciudad['size'].to_dict()
+    np.testing.assert_allclose(resultado.por_ciudad['estrellas'].sort_index(), por_ciudad['mean'].sort_index())
+    for atributo, columna in [('por_rating', 'PuntajeEstrellas'), ('por_codigo_estado', 'estado_canonico'),
+                              ('por_producto', 'product type'), ('por_sentimiento', 'Clasificacion')]:
+        esperado = vista[columna].value_counts()
+        assert getattr(resultado, atributo).sort_index().to_dict() == esperado[esperado > 0].sort_index().to_dict()
+    cruzada = pd.crosstab(vista['city'], vista['predicted_category'])
+    assert (resultado.ciudad_categoria.to_numpy() == cruzada.to_numpy()).all()
+    semanal = vista.set_index('fecha').resample('W').size()
+    assert resultado.serie_semanal.to_dict() == semanal.to_dict()
+
+
+def test_rollups_no_crecen_con_las_filas(dataset):
+    df, cubo_datos = dataset
+    for nombre, (clave, celdas) in cubo_datos.rollups.items():
+        assert not ('city' in clave and 'dia' in clave)
+        assert len(celdas['total']) < len(df) / 3, nombre
+
+
+def test_opciones_en_cascada(dataset):
+    df, cubo_datos = dataset
+    filtros = {'city': ('Chicago, IL',), 'fecha': (datetime.date(2025, 1, 1), datetime.date(2025, 1, 5))}
+    vista = df.take(indices.IndiceFiltros(df).filas(filtros))
+    assert cubo_datos.opciones('product type', filtros) == sorted(vista['product type'].unique())
+
+
+@pytest.mark.parametrize('filtros', FILTROS)
+def test_anexar_igual_que_reconstruir(dataset, filtros):
+    df, _ = dataset
+    # 1001 filas: el corte no cae en un byte entero de los bitmaps
+    anterior, delta = df.iloc[:1001], df.iloc[1001:].assign(city=df['city'].iloc[1001:].cat.add_categories(['Nueva, NY']))
+    delta.loc[delta.index[::7], 'city'] = 'Nueva, NY'
+    total = esquema.concatenar([anterior, delta])
+    indice_anterior = indices.IndiceFiltros(anterior)
+    indice = indice_anterior.anexar(total)
+    extendido = agregados.Agregados(cubo.Cubo(anterior, indice_anterior).anexar(total, indice), filtros)
+    reconstruido = agregados.Agregados(cubo.Cubo(total, indices.IndiceFiltros(total)), filtros)
+
+    filas, esperadas = indice.filas(filtros), indices.IndiceFiltros(total).filas(filtros)
+    assert (filas is None and esperadas is None) or np.array_equal(filas, esperadas)
+    assert extendido.total == reconstruido.total
+    assert extendido.por_ciudad.sort_index().equals(reconstruido.por_ciudad.sort_index())
+    assert extendido.serie_semanal.equals(reconstruido.serie_semanal)
+
+
+def test_modo_aproximado_usa_muestra_ponderada(dataset):
+    df, cubo_datos = dataset
+    # Ciudad y rango de fechas a la vez no caben en ningún roll-up: se recorren filas
+    filtros = {'city': ('Chicago, IL', 'Austin, TX'), 'fecha': (datetime.date(2025, 1, 1), datetime.date(2025, 3, 31))}
+    exacto = agregados.Agregados(cubo_datos, filtros)
+    estimado = agregados.Agregados(cubo_datos, filtros, limite_muestra=200)
+    assert not exacto.estimado and estimado.estimado
+    # Los pesos de cada categoría suman sus filas: total y conteos por categoría no cambian
+    assert estimado.total == exacto.total
+    assert estimado.por_categoria['total'].to_dict() == exacto.por_categoria['total'].to_dict()
+    assert estimado.rating_promedio == pytest.approx(exacto.rating_promedio, abs=0.3)
+    assert estimado.ciudades_distintas == exacto.ciudades_distintas
+    # Sin filtros todo sale de los roll-ups y sigue siendo exacto
+    assert not agregados.Agregados(cubo_datos, {}, limite_muestra=200).estimado
+
+
+def test_estimaciones_ponderadas_cerca_de_las_exactas(dataset):
+    _, cubo_datos = dataset
+    filtros = {'city': ('Chicago, IL', 'Austin, TX'), 'fecha': (datetime.date(2025, 1, 1), datetime.date(2025, 3, 31))}
+    exacto = agregados.Agregados(cubo_datos, filtros)
+    estimado = agregados.Agregados(cubo_datos, filtros, limite_muestra=400)
+    assert estimado.estimado
+    # Horvitz-Thompson: cada conteo estimado queda cerca del exacto y los totales cuadran
+    for atributo in ['por_ciudad', 'por_rating', 'por_producto', 'por_sentimiento']:
+        exactos, estimados = getattr(exacto, atributo), getattr(estimado, atributo)
+        if isinstance(exactos, pd.DataFrame):
+            exactos, estimados = exactos['total'], estimados['total']
+        estimados = estimados.reindex(exactos.index)
+        np.testing.assert_allclose(estimados, exactos, rtol=0.15, err_msg=atributo)
+
+
+def test_muestra_no_pasa_del_limite_con_muchos_estratos():
+    rng = np.random.default_rng(0)
+    filas = np.arange(5000)
+    for categorias in [3, 150, 400, 6000]:
+        estratos = rng.integers(-1, categorias, len(filas))
+        muestra, pesos = aproximado.muestra_ponderada(estratos, filas, 200)
+        assert len(muestra) == 200 and len(np.unique(muestra)) == 200
+        assert pesos.sum() == pytest.approx(len(filas))
+        if categorias < 200:
+            # Con menos categorías que el límite ninguna desaparece de la muestra
+            assert set(estratos[muestra]) == set(estratos)
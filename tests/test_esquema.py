@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+import esquema
+
+
+def test_filtrar_no_deja_categorias_en_cero():
+    df = esquema.aplicar_esquema(pd.DataFrame({'city': ['Chicago, IL', 'Austin, TX', 'Miami, FL'],
+                                               'PuntajeEstrellas': [5, 3, 1]}))
+    filtrado = esquema.quitar_categorias_sin_uso(df[df['city'] == 'Chicago, IL'])
+    assert filtrado['city'].value_counts().to_dict() == {'Chicago, IL': 1}
+    assert filtrado['PuntajeEstrellas'].dtype == np.int8
+
+
+def test_convertir_estrecha_solo_si_no_pierde_valores():
+    assert esquema._convertir(pd.Series([1, 5, 3]), 'int8').dtype == np.int8
+    assert esquema._convertir(pd.Series(['1', '5']), 'int8').tolist() == [1, 5]
+    # Con nulos se usa el entero nullable; decimales o valores fuera de rango conservan el flotante
+    con_nulos = esquema._convertir(pd.Series([1.0, np.nan]), 'int8')
+    assert con_nulos.dtype == 'Int8' and con_nulos.isna().tolist() == [False, True]
+    assert esquema._convertir(pd.Series([4.5, 3.0]), 'int8').tolist() == [4.5, 3.0]
+    assert esquema._convertir(pd.Series([200, 1]), 'int8').tolist() == [200, 1]
+    assert esquema._convertir(pd.Series(['3', 'sin dato']), 'int8').dtype == 'Int8'
+    assert esquema._convertir(pd.Series([0.25, 0.5]), 'float32').dtype == np.float32
+
+
+def test_aplicar_esquema_deja_intactas_las_demas_columnas():
+    df = pd.DataFrame({'city': ['Chicago, IL'], 'message': ['hola'], 'confidence': [0.9]})
+    tipado = esquema.aplicar_esquema(df)
+    assert isinstance(tipado['city'].dtype, pd.CategoricalDtype)
+    assert tipado['message'].dtype == df['message'].dtype
+    assert tipado['confidence'].dtype == np.float32
+    assert esquema.aplicar_esquema(tipado) is tipado   # ya tipado: no se vuelve a convertir
+
+
+def test_preparar_dataset_resuelve_alias_y_derivadas():
+    crudo = pd.DataFrame({
+        'Ciudad': ['Chicago, IL', 'Austin, TX', 'Miami, FL'],
+        'Rating': [5, 3, 1],
+        'State': ['Illinois', 'tx', None],
+        'zip_code': ['60601', '73301', '33101'],
+        'Email sent date': ['2025-03-01T23:30:00Z', '2025-03-02T10:00:00+02:00', 'no es fecha'],
+    })
+    df, capacidades = esquema.preparar_dataset(crudo)
+    assert capacidades.alias == {'Ciudad': 'city', 'Rating': 'PuntajeEstrellas', 'State': 'state_name',
+                                 'zip_code': 'zip code'}
+    assert df['PuntajeEstrellas'].dtype == np.int8
+    assert isinstance(df['city'].dtype, pd.CategoricalDtype)
+    # Fechas con zona pasan a UTC sin zona y las inválidas quedan NaT
+    assert df['fecha'].tolist()[:2] == [pd.Timestamp('2025-03-01 23:30'), pd.Timestamp('2025-03-02 08:00')]
+    assert pd.isna(df['fecha'].iloc[2])
+    # Sin state_name válido se usa el prefijo del código postal
+    assert df['estado_canonico'].tolist() == ['IL', 'TX', 'FL']
+    assert set(capacidades.derivadas) == {'fecha', 'estado_canonico'}
+
+
+def test_capacidades_por_seccion():
+    _, capacidades = esquema.preparar_dataset(pd.DataFrame({'city': ['Chicago, IL'], 'categoria': ['A']}))
+    assert capacidades.tiene('city', 'predicted_category')
+    assert capacidades.puede('top_ciudades') and capacidades.puede('pdf_categorias_ciudad')
+    assert not capacidades.puede('serie_temporal')
+    assert capacidades.faltantes('pdf_resumen_general') == ['PuntajeEstrellas']
+    assert capacidades.memoria() > 0
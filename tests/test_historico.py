@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import agregados
+import carga
+import cubo
+import esquema
+import historico
+import indices
+
+
+@pytest.fixture
+def directorio(tmp_path, monkeypatch):
+    monkeypatch.setattr(carga, 'DIRECTORIO_CACHE', str(tmp_path))
+    monkeypatch.setattr(historico, '_estado', historico._estado_vacio())
+    monkeypatch.setattr(carga, '_trabajos', carga.OrderedDict())
+    return tmp_path
+
+
+def lote(ids, zips, ciudad='Chicago, IL'):
+    return esquema.aplicar_esquema(pd.DataFrame({
+        'complaint id': ids,
+        'city': ciudad,
+        'predicted_category': 'A',
+        'PuntajeEstrellas': 4.0,
+        'zip code': pd.Series(zips, dtype=object),
+        'Email sent date': '2025-03-01',
+    }))
+
+
+def reiniciar_proceso(monkeypatch):
+    # Lo que se pierde al reiniciar: el histórico en memoria y las cachés del proceso
+    monkeypatch.setattr(historico, '_estado', historico._estado_vacio())
+    monkeypatch.setattr(indices, '_indices', carga.CacheLRU(indices.LIMITE_INDICES_BYTES))
+    monkeypatch.setattr(cubo, '_cubos', carga.CacheLRU(cubo.LIMITE_CUBOS_BYTES))
+
+
+def test_reinicio_recupera_todos_los_lotes(directorio, monkeypatch):
+    # 'zip code' con enteros y cadenas a la vez: Arrow no lo escribiría sin normalizar
+    df, version, _, nuevas = historico.fusionar(lote(['1', '2'], [2134, '02134-1234']), 'lote-1')
+    assert nuevas == 2
+    assert os.path.isdir(historico.directorio())
+
+    reiniciar_proceso(monkeypatch)
+    recargado, version_recargada, _ = historico.cargar()
+    assert version_recargada == version
+    assert recargado['complaint id'].tolist() == ['1', '2']
+    assert recargado['zip code'].tolist() == ['2134', '02134-1234']
+    assert recargado['estado_canonico'].tolist() == ['MA', 'MA']
+
+    # Tras reiniciar, un lote nuevo se suma a los anteriores y los repetidos no se duplican
+    df, version, _, nuevas = historico.fusionar(lote(['2', '3'], ['60601', '60602'], 'Austin, TX'), 'lote-2')
+    assert nuevas == 1
+    assert df['complaint id'].tolist() == ['1', '2', '3']
+    reiniciar_proceso(monkeypatch)
+    assert historico.cargar()[0]['complaint id'].tolist() == ['1', '2', '3']
+
+
+def test_cubo_extendido_igual_que_reconstruido(directorio):
+    historico.fusionar(lote(['1', '2'], ['02134', '60601']), 'lote-1')
+    df, version, _, _ = historico.fusionar(lote(['3', '4', '5'], ['73301', '73301', '02134'], 'Austin, TX'), 'lote-2')
+    extendido = agregados.Agregados(cubo.obtener(df, version), {})
+    reconstruido = agregados.Agregados(cubo.Cubo(df, indices.IndiceFiltros(df)), {})
+    assert extendido.por_ciudad.sort_index().equals(reconstruido.por_ciudad.sort_index())
+    assert extendido.por_codigo_estado.sort_index().equals(reconstruido.por_codigo_estado.sort_index())
+    filtros = {'city': ('Austin, TX',)}
+    np.testing.assert_array_equal(indices.obtener(df, version).filas(filtros),
+                                  indices.IndiceFiltros(df).filas(filtros))
+
+
+def test_escritura_fallida_no_marca_el_lote(directorio, monkeypatch):
+    historico.fusionar(lote(['1'], ['02134']), 'lote-1')
+
+    def fallar(nombre, df):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(historico, '_guardar_segmento', fallar)
+    with pytest.raises(OSError):
+        historico.fusionar(lote(['2'], ['02134']), 'lote-2')
+    assert historico._leer_metadatos()['aplicados'] == ['lote-1']
+    assert historico.cargar()[0]['complaint id'].tolist() == ['1']
+
+
+def test_vaciar_sube_la_generacion(directorio):
+    historico.fusionar(lote(['1'], ['02134']), 'lote-1')
+    generacion, _ = historico.estado()
+    historico.reiniciar()
+    assert historico.estado() == (generacion + 1, None)
+    assert historico.cargar() == (None, None, None)
+    # El mismo lote vuelve a entrar entero después de vaciar
+    assert historico.fusionar(lote(['1'], ['02134']), 'lote-1')[3] == 1
+
+
+def test_volver_a_un_lote_ya_fusionado_da_el_total_actual(directorio):
+    def cargar_lote(ids, hash_lote):
+        # Lo mismo que hace el dashboard en cada rerun: pedir el trabajo de esa clave y esperar su resultado
+        trabajo = historico.en_segundo_plano(
+            hash_lote, lambda progreso: historico.fusionar(lote(ids, ['02134'] * len(ids)), hash_lote))
+        df, _, _, nuevas = trabajo.resultado()
+        return len(df), nuevas, trabajo
+
+    filas, nuevas, trabajo_a = cargar_lote(['1', '2'], 'A')
+    assert (filas, nuevas) == (2, 2)
+    assert cargar_lote(['1', '2'], 'A')[2] is trabajo_a   # un rerun reutiliza el trabajo terminado
+    assert cargar_lote(['3'], 'B')[:2] == (3, 1)
+    # A → B → A: el histórico cambió, así que A no puede devolver el resultado de su primera carga
+    assert cargar_lote(['1', '2'], 'A')[:2] == (3, 0)
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+from branca.colormap import LinearColormap
+
+import mapas
+
+PALETA = ['#f22259', '#6f04d9', '#1b0273', '#0d0140']
+
+
+@pytest.mark.parametrize('vmin, vmax', [(0, 100), (3, 17), (5, 5), (0, 0)])
+def test_colores_igual_que_branca(vmin, vmax):
+    colormap = LinearColormap(colors=PALETA, vmin=vmin, vmax=vmax)
+    valores = np.concatenate([np.linspace(vmin - 10, vmax + 10, 101), colormap.index, [vmin, vmax]])
+    assert mapas.colores(colormap, valores) == [colormap(x) for x in valores]
+
+
+def test_colores_con_indice_propio():
+    colormap = LinearColormap(colors=PALETA, index=[0, 1, 10, 50])
+    valores = [-1, 0, 0.5, 1, 5, 10, 49.9, 50, 80]
+    assert mapas.colores(colormap, valores) == [colormap(x) for x in valores]